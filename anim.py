@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import time
+from array import array
+
+from euclid import quaternions_to_euler_degrees
+
+
+# Steps the Poser scene through a frame range and calls sample_frame(frame) on every frame. Joint transforms are
+# read straight from the actors after SetFrame, the viewport is only redrawn when redraw is set.
+class AnimationSampler:
+    def __init__(self, scene, redraw=False):
+        self.scene = scene
+        self.redraw = redraw
+        # seconds spent on every sampled frame
+        self.frame_times = []
+
+    def sample(self, frames, sample_frame):
+        scene = self.scene
+        current_frame = scene.Frame()
+        for frame in frames:
+            start = time.time()
+            scene.SetFrame(frame)
+            if self.redraw:
+                scene.DrawAll()
+            sample_frame(frame)
+            self.frame_times.append(time.time() - start)
+        scene.SetFrame(current_frame)
+        return self.frame_times
+
+    def report(self):
+        if not self.frame_times:
+            return 'no frames sampled'
+        total = sum(self.frame_times)
+        return '%d frames in %.3f s (%.2f ms/frame, slowest %.2f ms)' % (
+            len(self.frame_times), total, total * 1000.0 / len(self.frame_times), max(self.frame_times) * 1000.0)
+
+
+# channels of an <Xfm$Anim_S$> table in the order the exporter writes them
+CHANNELS = 'prhxyz'
+
+
+# Sampled joint transforms of a take: one contiguous array('d') per joint and channel, sized for every frame up
+# front, so sampling a long take does not allocate a tuple per joint and frame. Rotations are sampled as
+# quaternions and converted to p/r/h for the whole take at once by convert_rotations().
+class AnimStore:
+    def __init__(self, num_frames):
+        self.num_frames = num_frames
+        # joint name -> {channel: array('d')}
+        self.channels = {}
+        # joint name -> (w, x, y, z) arrays until convert_rotations()
+        self.quaternions = {}
+
+    def add_joints(self, joints):
+        empty = array('d', [0.0]) * self.num_frames
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            self.channels[joint_name] = dict([(channel, array('d', empty)) for channel in CHANNELS])
+            self.quaternions[joint_name] = tuple([array('d', empty) for i in xrange(4)])
+            self.add_joints(child_joints)
+
+    def joint(self, joint_name):
+        return self.channels[joint_name]
+
+    def set(self, joint_name, frame, displacement, quaternion):
+        channels = self.channels[joint_name]
+        channels['x'][frame] = displacement[0]
+        channels['y'][frame] = displacement[1]
+        channels['z'][frame] = displacement[2]
+        w, x, y, z = self.quaternions[joint_name]
+        w[frame], x[frame], y[frame], z[frame] = quaternion
+
+    def convert_rotations(self):
+        for joint_name, (w, x, y, z) in self.quaternions.items():
+            heading, attitude, bank = quaternions_to_euler_degrees(w, x, y, z)
+            channels = self.channels[joint_name]
+            channels['p'] = array('d', bank)
+            channels['r'] = array('d', attitude)
+            channels['h'] = array('d', heading)
+        self.quaternions = {}
+
+
+# Shrinks sampled joint channels before they are written. A channel whose samples stay within the tolerance is
+# stored once, and left out completely when that value is 0 (the default of a missing <S$Anim> channel).
+# Egg tables have no per-key times, so a varying channel has to keep every frame, and one channel always does so
+# the take keeps its length.
+class KeyframeReducer:
+    def __init__(self, tolerance=0.0001):
+        # None disables the reduction
+        self.tolerance = tolerance
+        # (joint name, samples saved, bytes saved)
+        self.savings = []
+
+    def reduce(self, joints, store, reduced=None):
+        top = reduced is None
+        if top:
+            reduced = {}
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            reduced[joint_name] = self.reduce_joint(joint_name, store.joint(joint_name))
+            self.reduce(child_joints, store, reduced)
+        if top:
+            self.keep_length(joints, store, reduced)
+        return reduced
+
+    def reduce_joint(self, joint_name, channels):
+        reduced = []
+        samples_saved = 0
+        bytes_saved = 0
+        for channel in CHANNELS:
+            values = channels[channel]
+            kept = self.reduce_channel(values)
+            samples, size = self._saved(values, kept)
+            samples_saved += samples
+            bytes_saved += size
+            if kept:
+                reduced.append((channel, kept))
+        self.savings.append((joint_name, samples_saved, bytes_saved))
+        return reduced
+
+    def keep_length(self, joints, store, reduced):
+        # Panda takes the number of frames of a bundle from its tables, a held pose with every channel reduced to
+        # one sample would load as a one frame take. Then the first channel of the root joint keeps every frame.
+        if store.num_frames < 2 or not joints:
+            return
+        for joint_channels in reduced.values():
+            for (channel, values) in joint_channels:
+                if len(values) == store.num_frames:
+                    return
+        joint_name = joints[0][0]
+        channels = dict(reduced[joint_name])
+        channel = reduced[joint_name] and reduced[joint_name][0][0] or CHANNELS[0]
+        values = store.joint(joint_name)[channel]
+        samples, size = self._saved(values, channels.get(channel, []))
+        channels[channel] = values
+        reduced[joint_name] = [(c, channels[c]) for c in CHANNELS if c in channels]
+        for i, (name, samples_saved, bytes_saved) in enumerate(self.savings):
+            if name == joint_name:
+                self.savings[i] = (name, samples_saved - samples, bytes_saved - size)
+
+    def _saved(self, values, kept):
+        # samples and bytes saved by writing kept instead of values
+        if len(kept) == len(values):
+            return 0, 0
+        return len(values) - len(kept), sum([len(str(v)) + 1 for v in values]) - sum([len(str(v)) + 1 for v in kept])
+
+    def reduce_channel(self, values):
+        if self.tolerance is None or not values:
+            return values
+        low, high = min(values), max(values)
+        if high - low > self.tolerance:
+            return values
+        value = (low + high) / 2.0
+        if abs(value) <= self.tolerance:
+            return []
+        return [value]
+
+    def report(self):
+        lines = ['%s: %d samples, %d bytes saved' % saving for saving in self.savings if saving[1]]
+        lines.append('animation reduced by %d samples, %d bytes' % (
+            sum([saving[1] for saving in self.savings]), sum([saving[2] for saving in self.savings])))
+        return '\n'.join(lines)
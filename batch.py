@@ -0,0 +1,153 @@
+############################################################
+#
+# batch.py - unattended export of many figures with poser2egg
+#
+# Reads a JSON job manifest and runs the exports back to back in one
+# Poser session:
+#
+# {
+#   "workers": 4,
+#   "options": {"morph": "BAKE_MORPHS", "textures": true},
+#   "report": "report.json",
+#   "jobs": [
+#     {"name": "v4", "scene": "scenes/v4.pz3", "figure": "Victoria 4",
+#      "output": "out/v4.egg", "animation": "out/v4-anim.egg",
+#      "options": {"morph": "SKIP_MORPHS"}},
+#     {"figure_file": "figures/prop.cr2", "output": "out/prop.egg"}
+#   ]
+# }
+#
+# Relative paths are relative to the manifest. "options" at the top are
+# EggObject options for every job, job options override them. "scene"
+# opens a document, "figure_file" loads a library figure into the scene,
+# "figure" picks a figure by name (current figure otherwise).
+# "animation" is optional, no animation egg is written without it.
+#
+# The manifest path is taken from the command line, the
+# POSER2EGG_MANIFEST environment variable or a file dialog.
+#
+############################################################
+import poser
+import os
+import sys
+import time
+import json
+
+from utils import *
+from egg import EggObject
+from poser2egg import Poser2Egg
+
+
+class BatchExporter:
+    def __init__(self, manifest, base_dir=''):
+        self.manifest = manifest
+        self.base_dir = base_dir
+        self.options = manifest.get("options", {})
+        self.exporter = Poser2Egg()
+        # worker pool reused by every job
+        self.pool = None
+        self.results = []
+
+    @classmethod
+    def load(cls, manifest_path):
+        manifest = json.load(open(manifest_path))
+        return cls(manifest, os.path.dirname(os.path.abspath(manifest_path)))
+
+    def path(self, path):
+        if path is None:
+            return None
+        return os.path.join(self.base_dir, path)
+
+    def run(self):
+        workers = self.manifest.get("workers", 0)
+        if workers:
+            try:
+                import multiprocessing
+                self.pool = multiprocessing.Pool(workers)
+            except (ImportError, OSError), e:
+                print 'Worker pool unavailable (%s), collecting in process' % e
+        start = time.time()
+        try:
+            for i, job in enumerate(self.manifest["jobs"]):
+                self.results.append(self.run_job(job.get("name", "job%d" % i), job))
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+        self.report(time.time() - start)
+        return self.results
+
+    def run_job(self, name, job):
+        result = {"name": name, "output": self.path(job["output"]), "ok": False}
+        print 'Batch job', name
+        start = time.time()
+        try:
+            figure = self.load_figure(job)
+            egg_obj = EggObject(figure)
+            options = dict(self.options)
+            options.update(job.get("options", {}))
+            for key, value in options.items():
+                if key not in egg_obj.options:
+                    raise ValueError('unknown option %s' % key)
+                egg_obj.options[key] = value
+            egg_obj.pool = self.pool
+            for path in (result["output"], self.path(job.get("animation"))):
+                if path and not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+            self.exporter.write_egg(egg_obj, result["output"], self.path(job.get("animation")))
+        except Exception, e:
+            result["error"] = '%s: %s' % (e.__class__.__name__, e)
+            print 'Batch job', name, 'failed:', result["error"]
+        else:
+            result["ok"] = True
+            result["vertices"] = len(egg_obj.vertices)
+            result["polygons"] = sum([len(group_polygons) for (group_name, group_polygons) in egg_obj.polygons])
+            result["bytes"] = os.path.getsize(result["output"])
+            if job.get("animation"):
+                result["bytes"] += os.path.getsize(self.path(job["animation"]))
+        result["seconds"] = time.time() - start
+        return result
+
+    def load_figure(self, job):
+        if job.get("scene"):
+            poser.OpenDocument(self.path(job["scene"]))
+        scene = poser.Scene()
+        if job.get("figure_file"):
+            scene.LoadLibraryFigure(self.path(job["figure_file"]))
+        if job.get("figure"):
+            figure = scene.Figure(job["figure"])
+        else:
+            figure = scene.CurrentFigure()
+        assert figure, 'No figure to export!'
+        return figure
+
+    def report(self, seconds):
+        done = [r for r in self.results if r["ok"]]
+        for r in self.results:
+            if r["ok"]:
+                print '%s: %.2f s, %d vertices (%.0f vertices/s), %.1f MB (%.2f MB/s)' % (
+                    r["name"], r["seconds"], r["vertices"], r["vertices"] / max(r["seconds"], 1e-6),
+                    r["bytes"] / 1048576.0, r["bytes"] / 1048576.0 / max(r["seconds"], 1e-6))
+            else:
+                print '%s: FAILED after %.2f s (%s)' % (r["name"], r["seconds"], r["error"])
+        total_bytes = sum([r["bytes"] for r in done])
+        print 'Batch: %d of %d jobs in %.2f s, %.1f MB (%.2f MB/s)' % (
+            len(done), len(self.results), seconds, total_bytes / 1048576.0, total_bytes / 1048576.0 / max(seconds, 1e-6))
+        if self.manifest.get("report"):
+            output = open(self.path(self.manifest["report"]), 'w')
+            json.dump({"seconds": seconds, "jobs": self.results}, output, indent=2)
+            output.close()
+
+
+def manifest_path():
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+    if os.environ.get('POSER2EGG_MANIFEST'):
+        return os.environ['POSER2EGG_MANIFEST']
+    getOpenFile = poser.DialogFileChooser(1, 0, "Open Batch Manifest", '', '', '*.json')
+    getOpenFile.Show()
+    return getOpenFile.Path()
+
+
+if __name__ == '__main__':
+    BatchExporter.load(manifest_path()).run()
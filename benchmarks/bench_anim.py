@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# Times EggObject.collect_anims with and without a viewport redraw per frame on a synthetic figure.
+# DrawAll is simulated by synthetic.DRAW_COST seconds of busy work.
+#
+#   python benchmarks/bench_anim.py [num_joints] [num_frames]
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import synthetic
+
+
+def run(redraw, num_joints, num_frames):
+    scene = synthetic.install(synthetic.make_snapshot(num_joints * 16, num_joints, 0, num_frames))
+    from egg import EggObject
+    from utils import ChunkBuffer
+    from writer import EggWriter
+    egg_obj = EggObject(scene.CurrentFigure())
+    egg_obj.options["anim_redraw"] = redraw
+    # tiny meshes, the export only sets up the joints for collect_anims
+    egg_obj.export(EggWriter(ChunkBuffer()))
+    start = time.time()
+    egg_obj.collect_anims()
+    return time.time() - start, scene.draw_calls
+
+
+def main(argv):
+    num_joints = int(argv[1]) if len(argv) > 1 else 60
+    num_frames = int(argv[2]) if len(argv) > 2 else 300
+    print 'synthetic figure: %d joints, %d frames, %.1f ms per DrawAll' % (
+        num_joints, num_frames, synthetic.DRAW_COST * 1000)
+    redraw_time, redraw_calls = run(True, num_joints, num_frames)
+    direct_time, direct_calls = run(False, num_joints, num_frames)
+    print 'redraw  %8.3f s  %6d DrawAll calls' % (redraw_time, redraw_calls)
+    print 'direct  %8.3f s  %6d DrawAll calls' % (direct_time, direct_calls)
+    print 'speedup %.2fx' % (redraw_time / max(direct_time, 1e-9))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
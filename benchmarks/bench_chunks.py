@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Compares the old `lines += 'text'` egg building against ChunkBuffer/EggWriter
+# on a synthetic figure. Runs outside Poser:
+#
+#   python benchmarks/bench_chunks.py [num_vertices] [num_joints] [num_frames]
+#
+import os
+import sys
+import time
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils import *
+from writer import EggWriter
+from anim import AnimStore, KeyframeReducer
+
+
+def make_figure(num_vertices, num_joints, num_frames):
+    vertices = [((math.sin(i), math.cos(i), i * 0.001), (0.0, 1.0, 0.0), ((i % 1000) / 1000.0, 0.5))
+                for i in xrange(num_vertices)]
+    matrix = ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0.5, 1.25, 0, 1))
+    per_joint = num_vertices // num_joints
+    joints = []
+    anims = {}
+    for j in xrange(num_joints):
+        name = 'joint%d' % j
+        joints.append((name, matrix, [], range(j * per_joint, (j + 1) * per_joint), None))
+        anims[name] = [((0.0, 0.1 * j, 0.0), (f * 0.5, 0.0, 0.25)) for f in xrange(num_frames)]
+    return vertices, joints, anims
+
+
+def make_store(joints, anims, num_frames):
+    store = AnimStore(num_frames)
+    store.add_joints(joints)
+    for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+        channels = store.joint(joint_name)
+        for frame, (displacement, hpr) in enumerate(anims[joint_name]):
+            for channel, value in zip('prhxyz', (hpr[2], hpr[1], hpr[0]) + displacement):
+                channels[channel][frame] = value
+    return store
+
+
+# the list building egg.py used before ChunkBuffer, kept here as the reference
+def legacy_transform(matrix, level):
+    r = [indent_string('<Transform> {\n', level)]
+    r += indent_string('<Matrix4> {\n', level + 1)
+    for row in matrix:
+        r.append(indent_string(" ".join([str(f) for f in row]), level + 2))
+        r.append('\n')
+    r.append(indent_string('}\n', level + 1))
+    r.append(indent_string('}\n', level))
+    return r
+
+
+def legacy_write(vertices, joints, anims, num_frames):
+    lines = []
+    lines += "<CoordinateSystem> { Y-Up-Right }\n"
+    for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+        lines += indent_string('  <Joint> %s {\n' % joint_name, 1)
+        lines += legacy_transform(joint_matrix, 2)
+        lines += indent_string('<VertexRef> {\n', 2)
+        lines.append(indent_string('%s\n' % ' '.join([str(v) for v in vertex_refs]), 3))
+        lines.append(indent_string('<Ref> { mesh }\n', 3))
+        lines.append(indent_string('}\n', 2))
+        lines += indent_string('  } // End joint %s \n' % joint_name, 1)
+    lines += '  <VertexPool> mesh {\n'
+    for i, (v_tuple, n, t) in enumerate(vertices):
+        lines.append('    <Vertex> %s { %f %f %f <Normal> { %f %f %f } <UV> { %f %f } }\n' %
+                     (str(i), v_tuple[0], v_tuple[1], v_tuple[2], n[0], n[1], n[2], t[0], t[1]))
+    lines += '  } // End VertexPool: mesh\n'
+    for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+        lines += indent_string('<Table> %s {\n' % joint_name, 3)
+        lines += indent_string('<V> {\n', 5)
+        for frame in xrange(num_frames):
+            displacement, hpr = anims[joint_name][frame]
+            lines += indent_string("%s %s %s %s %s %s\n" % (hpr[2], hpr[1], hpr[0],
+                                                            displacement[0], displacement[1], displacement[2]), 6)
+        lines += indent_string('}\n', 5)
+        lines += indent_string('} // End table %s \n' % joint_name, 3)
+    return lines
+
+
+def chunked_write(vertices, joints, anims, num_frames):
+    buf = ChunkBuffer()
+    writer = EggWriter(buf)
+    writer.write("<CoordinateSystem> { Y-Up-Right }\n")
+    writer.write_joints(joints)
+    writer.write_vertex_pool(vertices)
+    store = make_store(joints, anims, num_frames)
+    writer.write_animation_table(joints, KeyframeReducer(None).reduce(joints, store), 3)
+    return buf.chunks
+
+
+def measure(label, fn, *args):
+    start = time.time()
+    chunks = fn(*args)
+    elapsed = time.time() - start
+    size = sum([len(c) for c in chunks])
+    print '%-8s %10.3f s %12d list entries %12d list bytes %12d text bytes' % (
+        label, elapsed, len(chunks), sys.getsizeof(chunks), size)
+    return elapsed, len(chunks)
+
+
+def main(argv):
+    num_vertices = int(argv[1]) if len(argv) > 1 else 1000000
+    num_joints = int(argv[2]) if len(argv) > 2 else 100
+    num_frames = int(argv[3]) if len(argv) > 3 else 1000
+    print 'synthetic figure: %d vertices, %d joints, %d frames' % (num_vertices, num_joints, num_frames)
+    figure = make_figure(num_vertices, num_joints, num_frames)
+    legacy_time, legacy_entries = measure('legacy', legacy_write, *(figure + (num_frames, )))
+    chunk_time, chunk_entries = measure('chunked', chunked_write, *(figure + (num_frames, )))
+    print 'entries: %.1fx fewer, time: %.2fx faster' % (
+        float(legacy_entries) / chunk_entries, legacy_time / max(chunk_time, 1e-9))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# Vertex pool formatting throughput: the per-vertex % format write_vertex_pool used before against
+# VertexFormatter blocks at a few Precision settings. Runs outside Poser:
+#
+#   python benchmarks/bench_vertex_format.py [num_vertices] [block_size]
+#
+import os
+import sys
+import time
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from formatting import Precision, VertexFormatter
+
+
+def make_vertices(num_vertices):
+    return [((math.sin(i) * 10, math.cos(i) * 10, i * 0.001), (0.0, math.sin(i * 0.1), math.cos(i * 0.1)),
+             ((i % 1000) / 1000.0, 0.5)) for i in xrange(num_vertices)]
+
+
+# the per-vertex loop of write_vertex_pool before VertexFormatter, kept here as the reference
+def legacy_format(vertices):
+    chunks = []
+    write = chunks.append
+    for i, (v_tuple, n, t) in enumerate(vertices):
+        write('    <Vertex> %s { %f %f %f <Normal> { %f %f %f } <UV> { %f %f } }\n' %
+              (str(i), v_tuple[0], v_tuple[1], v_tuple[2], n[0], n[1], n[2], t[0], t[1]))
+    return chunks
+
+
+def measure(label, fn, vertices):
+    start = time.time()
+    chunks = fn(vertices)
+    elapsed = time.time() - start
+    size = sum([len(c) for c in chunks])
+    print '%-24s %10.3f s %12.0f vertices/s %12d bytes' % (label, elapsed, len(vertices) / max(elapsed, 1e-9), size)
+    return elapsed
+
+
+def main(argv):
+    num_vertices = int(argv[1]) if len(argv) > 1 else 1000000
+    block_size = int(argv[2]) if len(argv) > 2 else VertexFormatter.BLOCK_SIZE
+    print 'synthetic vertex pool: %d vertices, blocks of %d' % (num_vertices, block_size)
+    vertices = make_vertices(num_vertices)
+    legacy_time = measure('legacy %f', legacy_format, vertices)
+    for precision, strip_zeros in ((6, False), (4, False), (6, True), (4, True)):
+        formatter = VertexFormatter(Precision(precision, strip_zeros), block_size)
+        elapsed = measure('blocks precision %d%s' % (precision, strip_zeros and ' strip' or ''),
+                          lambda v: list(formatter.blocks(v)), vertices)
+        print '%24s %10.2fx' % ('', legacy_time / max(elapsed, 1e-9))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
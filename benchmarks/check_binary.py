@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Round trip check of the binary backend: a synthetic figure with material names that egg has to quote ("skin 0")
+# is exported to .p2eb through the replay module and read back with eggbin.read; the vertex pool, polygons and
+# their materials have to match what the exporter collected. Runs outside Poser:
+#
+#   python benchmarks/check_binary.py [num_vertices] [num_actors]
+#
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import synthetic
+
+
+def decode_polygons(record, materials):
+    # (material name, vertex indices) of every polygon of a polygons record
+    polygons = []
+    values = record.data
+    o = 0
+    for i in xrange(record.count):
+        count = values[o + 1]
+        polygons.append((materials[values[o]], list(values[o + 2:o + 2 + count])))
+        o += 2 + count
+    return polygons
+
+
+def main(argv):
+    num_vertices = int(argv[1]) if len(argv) > 1 else 2000
+    num_actors = int(argv[2]) if len(argv) > 2 else 5
+    scene = synthetic.install(synthetic.make_snapshot(num_vertices, num_actors, 0, 5, material_name='skin %d'))
+    import eggbin
+    from egg import EggObject
+    from poser2egg import Poser2Egg
+    egg_obj = EggObject(scene.CurrentFigure())
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'figure.p2eb')
+        Poser2Egg().write_egg(egg_obj, filename)
+        records = list(eggbin.iter_records(eggbin.read(filename)))
+    finally:
+        shutil.rmtree(directory)
+    errors = []
+    materials = [r.name for r in records if r.tag == eggbin.MATERIAL]
+    pools = [r for r in records if r.tag == eggbin.VERTEX_POOL]
+    if len(pools) != 1 or pools[0].count != len(egg_obj.vertices):
+        errors.append('vertex pool: %s vertices, exported %d' % ([r.count for r in pools], len(egg_obj.vertices)))
+    polygons = [p for r in records if r.tag == eggbin.POLYGONS for p in decode_polygons(r, materials)]
+    expected = [(egg_obj.materials[material].name.strip('"'), refs)
+                for (group_name, group_polys) in egg_obj.polygons for (material, refs) in group_polys]
+    if polygons != expected:
+        errors.append('polygons: %d read back, %d exported, %d differ' % (
+            len(polygons), len(expected), len([1 for p, e in zip(polygons, expected) if p != e])))
+    for error in errors:
+        print 'FAILED', error
+    if errors:
+        return 1
+    print 'binary round trip ok: %d vertices, %d polygons, materials %s' % (
+        len(egg_obj.vertices), len(polygons), ', '.join(sorted(materials)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
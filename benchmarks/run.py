@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmark suite for the export pipeline. Every combination of the given sizes is exported from a synthetic
+# figure in a fresh process, recording wall time, peak RSS and output bytes per stage:
+#
+#   python benchmarks/run.py --vertices 10000,100000,1000000 --actors 20 --morphs 2 --frames 100 \
+#       --output results.json --plot scaling.png
+#
+# Results are JSON so runs from different revisions can be compared; --plot draws time per stage against the
+# swept parameter (needs matplotlib). --morph-cache DIR exports through the morph delta cache; run twice to time
+# the cached case.
+#
+import os
+import sys
+import json
+import shutil
+import tempfile
+import itertools
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+PARAMETERS = ('vertices', 'actors', 'morphs', 'frames')
+
+
+def run_single(params, work_dir):
+    import synthetic
+    synthetic.install(synthetic.make_snapshot(params['vertices'], params['actors'], params['morphs'],
+                                              params['frames']))
+    import poser
+    from egg import EggObject
+    from writer import EggWriter
+
+    # stages are timed by the exporter's own instrumentation
+    egg_obj = EggObject(poser.Scene().CurrentFigure())
+    egg_obj.options["workers"] = params.get('workers', 0)
+    egg_obj.options["morph_cache"] = params.get('morph_cache')
+    filename = os.path.join(work_dir, 'bench.egg')
+    writer = EggWriter.open(filename)
+    egg_obj.export(writer)
+    egg_obj.write_animation(writer)
+    with egg_obj.instrument.stage('file_write'):
+        writer.close()
+    result = egg_obj.instrument.summary()
+    result.update({'params': params, 'egg_vertices': len(egg_obj.vertices), 'bytes': os.path.getsize(filename)})
+    return result
+
+
+def run_isolated(params):
+    # one process per configuration so peak RSS is not inherited from earlier runs
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--single', json.dumps(params)],
+                            stdout=subprocess.PIPE)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise RuntimeError('benchmark run %s failed' % params)
+    return json.loads(out.splitlines()[-1])
+
+
+def plot(results, axis, filename):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print 'matplotlib not installed, skipping plot'
+        return
+    results = sorted(results, key=lambda r: r['params'][axis])
+    xs = [r['params'][axis] for r in results]
+    for stage in [s['stage'] for s in results[0]['stages']]:
+        ys = [[s['seconds'] for s in r['stages'] if s['stage'] == stage][0] for r in results]
+        plt.plot(xs, ys, marker='o', label=stage)
+    plt.plot(xs, [r['seconds'] for r in results], marker='o', linewidth=2, color='black', label='total')
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.xlabel(axis)
+    plt.ylabel('seconds')
+    plt.legend(loc='upper left', fontsize='small')
+    plt.savefig(filename)
+    print 'plot written to', filename
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--vertices', default='10000,100000')
+    parser.add_option('--actors', default='20')
+    parser.add_option('--morphs', default='0')
+    parser.add_option('--frames', default='30')
+    parser.add_option('--workers', type='int', default=0)
+    parser.add_option('--morph-cache', dest='morph_cache', help='morph delta cache directory')
+    parser.add_option('--output', help='write results as JSON')
+    parser.add_option('--plot', help='write a scaling plot (PNG)')
+    parser.add_option('--axis', default='vertices', help='parameter on the x axis of the plot')
+    parser.add_option('--single', help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    if options.single:
+        work_dir = tempfile.mkdtemp()
+        try:
+            result = run_single(json.loads(options.single), work_dir)
+        finally:
+            shutil.rmtree(work_dir)
+        sys.stdout.write(json.dumps(result) + '\n')
+        return
+    sweep = [[int(v) for v in getattr(options, name).split(',')] for name in PARAMETERS]
+    results = []
+    for values in itertools.product(*sweep):
+        params = dict(zip(PARAMETERS, values))
+        params['workers'] = options.workers
+        params['morph_cache'] = options.morph_cache
+        result = run_isolated(params)
+        results.append(result)
+        print '%s: %.3f s, %d bytes, peak RSS %s KB' % (
+            ', '.join(['%s=%d' % (name, params[name]) for name in PARAMETERS]),
+            result['seconds'], result['bytes'], result['peak_memory_kb'])
+        for s in result['stages']:
+            print '  %-18s %9.3f s %12s bytes' % (s['stage'], s['seconds'], s['bytes'] is not None and s['bytes'] or '-')
+    if options.output:
+        output = open(options.output, 'w')
+        json.dump({'python': sys.version.split()[0], 'results': results}, output, indent=2)
+        output.close()
+    if options.plot:
+        plot(results, options.axis, options.plot)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Synthetic figures for the benchmarks. make_snapshot() builds a snapshot in the format of snapshot.py and
+# install() replays it through poserreplay as the `poser` module, so it has to run before egg.py is imported:
+#
+#   import synthetic
+#   synthetic.install(synthetic.make_snapshot(num_vertices=100000, num_actors=20))
+#
+import math
+import time
+
+import snapshot
+import poserreplay
+
+# simulated cost of one viewport redraw in seconds
+DRAW_COST = 0.005
+
+
+def _busy_wait(seconds):
+    # DrawAll keeps Poser busy rather than asleep, so spin instead of time.sleep
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def _grid(num_vertices, offset, materials):
+    # quad grid of roughly num_vertices vertices with the same layout Poser uses for Sets/TexSets
+    nx = max(1, int(math.sqrt(num_vertices)) - 1)
+    ny = max(1, num_vertices // (nx + 1) - 1)
+    vertices, uvs = [], []
+    for j in xrange(ny + 1):
+        for i in xrange(nx + 1):
+            vertices.extend((i * 0.01 + offset, j * 0.01, math.sin(i * 0.3) * 0.01))
+            uvs.extend((i / float(nx), j / float(ny)))
+    polygons, sets, polygon_materials = [], [], []
+    for j in xrange(ny):
+        for i in xrange(nx):
+            a = j * (nx + 1) + i
+            polygons.extend((len(sets), 4))
+            sets.extend((a, a + 1, a + nx + 2, a + nx + 1))
+            polygon_materials.append((i // 8 + j // 8) % len(materials))
+    num = (nx + 1) * (ny + 1)
+    return {'vertices': snapshot.pack('d', vertices), 'normals': snapshot.pack('d', (0.0, 0.0, 1.0) * num),
+            'tex_vertices': snapshot.pack('d', uvs), 'polygons': snapshot.pack('i', polygons),
+            'tex_polygons': snapshot.pack('i', polygons), 'material_names': materials,
+            'polygon_materials': snapshot.pack('i', polygon_materials),
+            'sets': snapshot.pack('i', sets), 'tex_sets': snapshot.pack('i', sets)}, num
+
+
+def _morph(name, num_vertices, seed):
+    # moves every third vertex
+    indices = range(seed % 3, num_vertices, 3)
+    deltas = []
+    for v in indices:
+        deltas.extend((0.0, 0.001 * ((v + seed) % 7), 0.0))
+    return {'name': name, 'value': 0.5, 'hidden': 0,
+            'indices': snapshot.pack('i', indices), 'deltas': snapshot.pack('d', deltas)}
+
+
+def make_snapshot(num_vertices=10000, num_actors=10, num_morphs=0, num_frames=30, num_materials=4,
+                  material_name='material%d'):
+    materials = [material_name % i for i in xrange(num_materials)]
+    frames = range(num_frames)
+    actors = []
+    for a in xrange(num_actors):
+        # chains of five actors hanging off the hip
+        if a == 0:
+            parent = -1
+        elif a % 5 == 1:
+            parent = 0
+        else:
+            parent = a - 1
+        geometry, count = _grid(num_vertices // num_actors, a * 2.0, materials)
+        origins, quaternions = [], []
+        for frame in frames:
+            angle = 0.01 * frame * (a % 5)
+            origins.extend((0.0, 0.1 * a, 0.0))
+            quaternions.extend((math.cos(angle / 2), 0.0, math.sin(angle / 2), 0.0))
+        actors.append({'name': a and 'actor%d' % a or 'hip', 'internal_name': 'actor%d:1' % a, 'body_part': 1,
+                       'parent': parent, 'children': [],
+                       'world_matrix': ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0.1 * a, 0, 1)),
+                       'local_matrix': ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0.1, 0, 1)),
+                       'geometry': geometry,
+                       'morphs': [_morph('morph%d' % m, count, a + m) for m in xrange(num_morphs)],
+                       'origins': snapshot.pack('d', origins), 'quaternions': snapshot.pack('d', quaternions)})
+        if parent >= 0:
+            actors[parent]['children'].append(a)
+    return {'version': snapshot.VERSION, 'content_root': 'C/Content', 'num_frames': num_frames + 1,
+            'frames': frames,
+            'figure': {'name': 'Synthetic', 'root': 0, 'unimesh': range(num_actors),
+                       'materials': [{'name': name, 'texture': 'C:\\textures\\%s.png' % name, 'bump': None,
+                                      'transparency': None, 'diffuse': (0.8, 0.7, 0.6), 'specular': (1.0, 1.0, 1.0)}
+                                     for name in materials]},
+            'actors': actors}
+
+
+def install(data, draw_cost=DRAW_COST):
+    scene = poserreplay.install(data)
+
+    def draw_all():
+        scene.draw_calls += 1
+        _busy_wait(draw_cost)
+    scene.DrawAll = draw_all
+    return scene
@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import poser
+import json
+
 from utils import *
-from euclid import Quaternion
+from mesh import snapshot_actor, figure_normals, collect_actors, sort_polygons
+from normals import tangent_frames
+from morphs import active_morphs, morph_targets
+from anim import AnimationSampler, AnimStore, KeyframeReducer
+from profiling import Instrumentation
+from morphcache import MorphCache
+from incremental import ExportManifest, actor_hash, manifest_path
+from formatting import Precision
 
 #supported poser texture modes
 class TextureMode:
@@ -21,18 +31,33 @@ class EggMaterial:
                    self._check_texture(poser_material.BumpMapFileName(), '_bump', TextureMode.NORMAL),
                    self._check_texture(poser_material.TransparencyMapFileName(), '_transparency', TextureMode.ALPHA)]
         self.textures = filter(None, textures)
+        self.diffuse = poser_material.DiffuseColor()
+        sr, sg, sb = poser_material.SpecularColor()
+        self.specular = (sr * 0.2, sg * 0.2, sb * 0.2)
+        self.shininess = 25
+        # every polygon of the material starts the same, with and without textures
+        self.polygon_headers = {True: self.polygon_header(True), False: self.polygon_header(False)}
 
     def _check_texture(self, textureName, egg_texture_name, egg_texture_mode):
         texture = EggTexture(textureName, self.name + egg_texture_name, egg_texture_mode)
         return texture.check_texture()
 
-    def write(self):
-        lines = ["<Material> %s {\n" % self.name]
-        lines += "   <Scalar> diffr {%f} <Scalar> diffg {%f} <Scalar> diffb {%f}\n" % (self.poser_material.DiffuseColor())
-        sr, sg, sb = self.poser_material.SpecularColor()
-        lines += "   <Scalar> specr {%f} <Scalar> specg {%f} <Scalar> specb {%f}\n" % (sr * 0.2, sg * 0.2, sb * 0.2)
-        lines += "   <Scalar> shininess { 25 }"
-        lines += "\n}\n"
+    def polygon_header(self, write_textures=True):
+        # <Polygon> text up to its vertex indices
+        trefs = ''
+        if write_textures:
+            trefs = ' '.join(["<TRef> {%s}" % texture_name for texture_name in self.textures])
+        return "  <Polygon> {\n    %s\n    <MRef> { %s } \n    <VertexRef> { " % (trefs, self.name)
+
+    def write(self, precision=None):
+        format_float = (precision or Precision()).formatter('material')
+        lines = ChunkBuffer("<Material> %s {\n" % self.name)
+        lines.write("   <Scalar> diffr {%s} <Scalar> diffg {%s} <Scalar> diffb {%s}\n" %
+                    tuple(map(format_float, self.diffuse)))
+        lines.write("   <Scalar> specr {%s} <Scalar> specg {%s} <Scalar> specb {%s}\n" %
+                    tuple(map(format_float, self.specular)))
+        lines.write("   <Scalar> shininess { %d }" % self.shininess)
+        lines.write("\n}\n")
         return lines
 
     def __str__(self):
@@ -46,6 +71,9 @@ class EggTexture:
 
     def __init__(self, filename, texture_name, texture_mode):
         self.texture_mode = texture_mode
+        # poser transparency textures are separate file and exported as pure alpha in egg
+        self.alpha = texture_mode == TextureMode.ALPHA
+        self.envtype = self.alpha and TextureMode.MODULATE or texture_mode
         self.filename = None
         if filename is not None:
             self.filename = filename.replace("\\", '/').replace(":", "")
@@ -59,18 +87,34 @@ class EggTexture:
         return None
 
     def write(self):
-        lines = ["<Texture> %s {\n \"%s\" \n" % (self.name, self.filename)]
-        # poser transparency textures are separate file and exported as pure alpha in egg
-        if self.texture_mode == TextureMode.ALPHA:
-            lines += "   <Scalar> format { alpha }\n"
-            lines += "   <Scalar> envtype { %s }" % TextureMode.MODULATE
-        else:
-            lines += "   <Scalar> envtype { %s }" % self.texture_mode
-        lines += "   <Scalar> wrap { %s }" % 'REPEAT'
-        lines += "\n}\n"
+        lines = ChunkBuffer("<Texture> %s {\n \"%s\" \n" % (self.name, self.filename))
+        if self.alpha:
+            lines.write("   <Scalar> format { alpha }\n")
+        lines.write("   <Scalar> envtype { %s }" % self.envtype)
+        lines.write("   <Scalar> wrap { %s }" % 'REPEAT')
+        lines.write("\n}\n")
         return lines
 
 
+# Lookup of the actors returned by UnimeshInfo(): InternalName -> unimesh index and back
+class ActorIndex:
+    def __init__(self, actors):
+        self.actors = list(actors)
+        self.indices = dict([(actor.InternalName(), i) for i, actor in enumerate(self.actors)])
+
+    def index(self, actor):
+        return self.indices.get(actor.InternalName())
+
+    def actor(self, index):
+        return self.actors[index]
+
+    def __len__(self):
+        return len(self.actors)
+
+    def __iter__(self):
+        return iter(self.actors)
+
+
 class EggObject:
     empty_texture = poser.ContentRootLocation()
     SKIP_MORPHS = 'SKIP_MORPHS'
@@ -78,45 +122,187 @@ class EggObject:
     EXPORT_MORPHS = 'EXPORT_MORPHS'
 
     def __init__(self, figure):
-        self.options = {"morph": self.BAKE_MORPHS, "textures": True}
+        self.options = {"morph": self.BAKE_MORPHS, "textures": True,
+                        # EXPORT_MORPHS only writes the vertices a morph moves further than this along any axis
+                        "morph_threshold": 0.00001,
+                        # directory of the on-disk morph delta cache and its size limit in bytes, None to skip
+                        "morph_cache": None, "morph_cache_size": MorphCache.MAX_BYTES,
+                        # share one egg vertex between polygon corners with equal position/normal/uv
+                        "weld": True, "weld_epsilon": 0.0,
+                        # recompute smooth normals with this crease angle in degrees, None keeps the poser normals
+                        "normal_angle": None,
+                        # write <Tangent>/<Binormal> for normal mapping
+                        "tbn": False,
+                        # decimals per attribute ({"position": 4, "matrix": 6, ...}, see formatting.Precision) or
+                        # one number for all, strip_zeros writes 0.5 instead of 0.500000: about 15% smaller vertex
+                        # pools, formatted at about half the speed (benchmarks/bench_vertex_format.py)
+                        "precision": None, "strip_zeros": False,
+                        # order the polygons of every actor group by material, material_groups also puts each
+                        # material in its own <Group> inside the actor group (and implies sorting)
+                        "sort_polygons": False, "material_groups": False,
+                        # worker processes for per-actor geometry processing, 0 keeps it in process
+                        "workers": 0,
+                        # redraw the viewport on every sampled animation frame
+                        "anim_redraw": False,
+                        # animation channels varying less than this are written once, None keeps every frame
+                        "anim_tolerance": 0.0001,
+                        # copy the blocks of unchanged actors from the previous export, see incremental.py
+                        "incremental": False,
+                        # cProfile stats file and JSON stage summary file, None to skip
+                        "profile": None, "stats_file": None}
         self.figure = figure
         self.figure_name = fix_name(figure.Name())
-
-    def export(self):
+        # multiprocessing pool shared between exports, see collect_actors
+        self.pool = None
+        self.instrument = Instrumentation()
+        # incremental export: PreviousExport of the output file, set by Poser2Egg.write_egg, and the manifest of
+        # the egg being written
+        self.previous = None
+        self.manifest = None
+        self.actor_hashes = None
+
+    def export(self, writer):
+        if self.options["profile"]:
+            self.instrument.start_profile()
+        if self.options["incremental"]:
+            self.manifest = ExportManifest(self.options)
+            if self.previous is not None and not self.previous.matches(self.options):
+                print 'Export options changed since the last export, nothing is reused'
+                self.previous.close()
+                self.previous = None
         # get geometry from poser
-        uniGeometry, self.uniActorList, self.uniActorVertexInfoList = self.figure.UnimeshInfo()
+        with self.instrument.stage('unimesh') as stage:
+            uniGeometry, self.uniActorList, self.uniActorVertexInfoList = self.figure.UnimeshInfo()
+            self.actor_index = ActorIndex(self.uniActorList)
+            stage.items = len(self.actor_index)
         # collect materials/textures
-        self.materials, self.textures = self.collect_materials(self.figure)
+        with self.instrument.stage('collect_materials') as stage:
+            self.materials, self.textures = self.collect_materials(self.figure)
+            stage.items = len(self.materials)
         # collect vertices
-        self.vertices, self.polygons, self.poser2egg = self.collect_vertices(self.uniActorList)
+        with self.instrument.stage('collect_vertices') as stage:
+            self.vertices, self.polygons, self.poser2egg, self.morphs = self.collect_vertices(self.actor_index)
+            stage.items = len(self.vertices)
+        # tangents are averaged on the welded vertices
+        self.tangents = None
+        if self.options["tbn"]:
+            with self.instrument.stage('compute_tbn') as stage:
+                self.tangents = tangent_frames(self.vertices, self.polygons)
+                stage.items = len(self.tangents)
+        # fewer material switches within a group, after the tangents so they are summed in poser order
+        if self.options["sort_polygons"] or self.options["material_groups"]:
+            with self.instrument.stage('sort_polygons') as stage:
+                self.polygons = sort_polygons(self.polygons)
+                stage.items = len(self.polygons)
         # collect joints
-        self.joints = self.collect_joints(self.figure.ParentActor(), 1)
+        with self.instrument.stage('collect_joints') as stage:
+            self.joints = self.collect_joints(self.figure.ParentActor(), 1)
+            self.num_joints = self.count_joints(self.joints or [])
+            stage.items = self.num_joints
         # write egg content
-        return self.write()
+        self.write(writer)
 
-    def write(self):
-        lines = []
-        lines += "<CoordinateSystem> { Y-Up-Right }\n"
-        lines += write_comment('poser2egg - ' + self.figure_name, 0)
+    def precision(self):
+        return Precision(self.options["precision"], self.options["strip_zeros"])
+
+    def write(self, writer):
+        precision = self.precision()
         # write materials and textures
-        print 'Writing Materials ...'
-        lines + self.write_materials()
+        with self.instrument.stage('write_materials', writer) as stage:
+            writer.write_header(self.figure_name)
+            writer.write_materials(self.materials, self.textures, self.options["textures"] == True, precision)
+            stage.items = len(self.materials)
         # write rig
-        print 'Writing Rig ...'
-        lines += "<Group> %s {\n  <Dart> { 1 }\n" % (self.figure_name, )
-        # write joints
-        lines += self.write_joints(self.joints)
-        poser.Scene().ProcessSomeEvents()
+        with self.instrument.stage('write_joints', writer) as stage:
+            writer.write_figure_begin(self.figure_name)
+            # write joints
+            writer.write_joints(self.joints, 1, precision)
+            stage.items = self.num_joints
+            poser.Scene().ProcessSomeEvents()
         # write vertex pool
-        print 'Writing vertices ...'
-        lines += self.write_vertex_pool()
-        poser.Scene().ProcessSomeEvents()
+        with self.instrument.stage('write_vertex_pool', writer) as stage:
+            if self.manifest is None:
+                writer.write_vertex_pool(self.vertices, self.tangents, precision, self.morphs)
+            else:
+                writer.write_vertex_pool_begin()
+                self.write_actor_blocks(writer, 'pool', lambda k, first, last: writer.write_vertex_rows(
+                    self.vertices, self.tangents, precision, self.morphs, first, last))
+                writer.write_vertex_pool_end()
+            stage.items = len(self.vertices)
+            poser.Scene().ProcessSomeEvents()
         # write polygons
-        print 'Writing Polygons ...'
-        lines += self.write_polygons()
-        poser.Scene().ProcessSomeEvents()
-        lines += '} // End Group: %s \n' % (self.figure_name, )
-        return lines
+        with self.instrument.stage('write_polygons', writer) as stage:
+            if self.manifest is None:
+                writer.write_polygons(self.polygons, self.materials, self.options["textures"] == True,
+                                      self.options["material_groups"])
+            else:
+                self.write_actor_blocks(writer, 'polygons', lambda k, first, last: writer.write_polygon_group(
+                    self.polygons[k][0], self.polygons[k][1], self.materials, self.options["textures"] == True,
+                    self.options["material_groups"]))
+            stage.items = sum([len(group_polys) for (group_name, group_polys) in self.polygons])
+            poser.Scene().ProcessSomeEvents()
+            writer.write_figure_end(self.figure_name)
+        if not precision.is_default():
+            print precision.report(self.precision_savings(precision))
+
+    def write_actor_blocks(self, writer, kind, write_block):
+        # blocks of unchanged actors are copied from the previous egg, the others are written by
+        # write_block(actor number, first vertex, end vertex); the byte range of every block goes to the manifest
+        first = 0
+        for k, (actor_name, content_hash) in enumerate(self.actor_hashes):
+            last = first + len(self.poser2egg[k])
+            start = writer.tell()
+            text = None
+            if self.previous is not None:
+                text = self.previous.block(actor_name, content_hash, first, kind)
+            if text is not None:
+                writer.write(text)
+            else:
+                write_block(k, first, last)
+            self.manifest.add(actor_name, content_hash, first, kind, start, writer.tell())
+            first = last
+
+    def finish_incremental(self, filename):
+        # the egg is complete: store its manifest next to it and drop the previous egg
+        self.manifest.save(manifest_path(filename))
+        reused = 0
+        if self.previous is not None:
+            reused = self.previous.reused
+            self.previous.close()
+            self.previous = None
+        print 'Incremental export: reused %d of %d actor blocks' % (reused, 2 * len(self.actor_hashes))
+
+    def precision_savings(self, precision):
+        # estimated on a sample of the vertex pool
+        num_vertices = len(self.vertices)
+        step = max(1, num_vertices // Precision.SAMPLE_SIZE)
+        sample = self.vertices[::step]
+        normals = [f for (v_tuple, n, t) in sample for f in n]
+        num_normals = 3 * num_vertices
+        if self.tangents is not None:
+            normals += [f for (tangent, binormal) in self.tangents[::step] for f in tangent + binormal]
+            num_normals *= 3
+        matrices = []
+        joints = list(self.joints)
+        while joints:
+            (joint_name, joint_matrix, child_joints, vertex_refs, actor) = joints.pop()
+            matrices += [f for row in joint_matrix for f in row]
+            joints += child_joints
+        return [('position', precision.bytes_saved('position', [f for (v_tuple, n, t) in sample for f in v_tuple],
+                                                   3 * num_vertices)),
+                ('normal', precision.bytes_saved('normal', normals, num_normals)),
+                ('uv', precision.bytes_saved('uv', [f for (v_tuple, n, t) in sample for f in t], 2 * num_vertices)),
+                ('material', precision.bytes_saved('material', [f for material in self.materials.values()
+                                                                for f in material.diffuse + material.specular])),
+                ('matrix', precision.bytes_saved('matrix', matrices))]
+
+    def finish(self):
+        # end of the export: stop profiling and emit the stage summary
+        if self.options["profile"]:
+            self.instrument.stop_profile(self.options["profile"])
+        if self.options["stats_file"]:
+            self.instrument.write_summary(self.options["stats_file"])
+        print 'poser2egg stats:', json.dumps(self.instrument.summary())
 
     def collect_joints(self, actor, level):
         if not actor.IsBodyPart() or actor.Name() == 'BodyMorphs':
@@ -133,7 +319,7 @@ class EggObject:
             matrix = actor.LocalMatrix()
         vertex_refs = []
         if actor.Geometry():
-            vertex_refs = self.poser2egg[self.get_actor_index(actor)]
+            vertex_refs = self.poser2egg[self.actor_index.index(actor)]
         child_joints = []
         for child in actor.Children():
             child_joint = self.collect_joints(child, level + 1)
@@ -141,207 +327,110 @@ class EggObject:
                 child_joints += child_joint
         return [(actorName, matrix, child_joints, vertex_refs, actor)]
 
-    def write_joints(self, joint, indent=1):
-        lines = []
-        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joint:
-            #print joint_name
-            lines += indent_string('  <Joint> %s {\n' % joint_name, indent)
-            lines += write_transform(joint_matrix, indent + 1)
-
-            lines += indent_string('<VertexRef> {\n', indent + 1)
-            vx = [str(v) for v in vertex_refs]
-            lines.append(indent_string('%s\n' % (' '.join(vx)), indent + 2))
-            lines.append(indent_string('<Ref> { mesh }\n', indent + 2))
-            lines.append(indent_string('}\n', indent + 1))
-
-            lines += self.write_joints(child_joints, indent + 1)
-            lines += indent_string('  } // End joint %s \n' % joint_name, indent)
-
-        return lines
-
-    def get_actor_index(self, actor):
-        for i, a in enumerate(self.uniActorList):
-            if a.InternalName() == actor.InternalName():
-                return i
-        return None
+    def count_joints(self, joints):
+        # joints in a tree returned by collect_joints, children included
+        return sum([1 + self.count_joints(child_joints)
+                    for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints])
 
     def collect_materials(self, figure):
+        # texture names come from the material that first uses a file, so they are only unique within one figure:
+        # every export (batch jobs share the class) starts with an empty registry
+        EggTexture.ALL_TEXTURES = {}
         egg_materials = {}
         for material in figure.Materials():
             mat_name = material.Name()
             if mat_name == 'Preview':
                 continue
             egg_materials[mat_name] = EggMaterial(material)
-        return egg_materials, EggTexture.ALL_TEXTURES
-
-    def write_materials(self):
-        lines = []
-        for material in self.materials.values():
-            lines += material.write()
-        if self.options["textures"] == True:
-            for texture in self.textures.values():
-                lines += texture.write()
-        return lines
+        return egg_materials, dict(EggTexture.ALL_TEXTURES)
 
-    def collect_vertices(self, uniActorList):
+    def collect_vertices(self, actors):
         bake_morph = self.options["morph"] == self.BAKE_MORPHS
+        export_morph = self.options["morph"] == self.EXPORT_MORPHS
         print 'Collecting vertices ...'
-        egg_vertices = []
-        egg_polygons = []
-        poser2egg = {}
-        self.egg_uvs = {}
-        # egg vertex index is different from poser
-        vertex_index = 0
-        for actor in uniActorList:
+        cache = None
+        if self.options["morph_cache"] and (bake_morph or export_morph):
+            cache = MorphCache(self.options["morph_cache"], self.options["morph_cache_size"])
+        # copy geometry out of poser on the main thread, the rest can run in worker processes
+        snapshots = []
+        for actor_index, actor in enumerate(actors):
             print actor.Name()
-            actor_index = self.get_actor_index(actor)
-            poser2egg[actor_index] = {}
-            # get actor geom data
-            geom = actor.Geometry()
-            # check morph options
+            # check morph options and bake all active morphs into the actor vertices at once
+            morphs = []
             if bake_morph:
-                all_params = actor.Parameters()
-                # get morph targets
-                #morphs = [p for p in all_params if not p.Name().startswith('EMPTY') and not p.Name().startswith('V4') and p.Name() != '-' and p.IsMorphTarget() and (abs(p.Value()-0.0) > 0.001) and p.Hidden() != 1]
-                morphs = [p for p in all_params if p.IsMorphTarget() and not p.Name().startswith('EMPTY') and p.Name() != '-' and not p.Name().startswith('V4') and (abs(p.Value() - 0.0) > 0.1)]
-                #morphs = [p for p in all_params if p.IsMorphTarget() and p.IsValueParameter() and (abs(p.Value() - 0.0) > 0.1)]
-                # poser vertices/texture data
-            vertices, tex_vertices, normals = geom.Vertices(), geom.TexVertices(), geom.Normals()
-            # poser polygon/texture data (index to start in sets/tex_sets + number of vertices)
-            polygons, tex_polygons = geom.Polygons(), geom.TexPolygons()
-            # poser sets/texture sets containing vertices id for vertices/tex_vertices arrays
-            sets, tex_sets = geom.Sets(), geom.TexSets()
-            # collect all geom data for current actor and present as egg group
-            group_name = fix_name(actor.Name())
-            group_polygons = []
-            for polygon_index, polygon in enumerate(polygons):
-                poly_start = vertex_index
-                start = polygon.Start()
-                # get tex_polygon and tex_set for current polygon
-                tex_polygon = tex_polygons[polygon_index]
-                tex_set = tex_sets[tex_polygon.Start(): tex_polygon.Start() + tex_polygon.NumTexVertices()]
-                # get all polygon vertices
-                for k, v in enumerate(sets[start: start + polygon.NumVertices()]):
-                    vertex = vertices[v]
-                    self.egg_uvs[start + k] = tex_vertices[tex_set[k]]
-                    x, y, z = vertex.X(), vertex.Y(), vertex.Z()
-                    if bake_morph:
-                        for morph in morphs:
-                            dx, dy, dz = morph.MorphTargetDelta(v)
-                            x += dx * morph.Value()
-                            y += dy * morph.Value()
-                            z += dz * morph.Value()
-                    egg_vertices.append((vertex_index, (x, y, z), normals[v], tex_vertices[tex_set[k]]))
-                    poser2egg[actor_index][vertex_index] = vertex_index
-                    # increment egg vertex index
-                    vertex_index += 1
-                    # add egg polygon data to group polygons (poser polygon + start/length in egg_vertices list)
-                group_polygons.append((polygon, poly_start, vertex_index - poly_start))
-            egg_polygons.append((group_name, group_polygons))
+                morphs = active_morphs(actor)
+            # or write every morph target as a slider on the unmorphed mesh
+            sliders = []
+            if export_morph:
+                sliders = morph_targets(actor)
+            snapshots.append(snapshot_actor(actor_index, actor, morphs, sliders, self.options["morph_threshold"],
+                                            cache, self.figure_name))
             poser.Scene().ProcessSomeEvents()
-        return egg_vertices, egg_polygons, poser2egg
-
-    def write_vertex_pool(self):
-        lines = []
-        lines += '  <VertexPool> mesh {\n'
-        for (i, v_tuple, n, t) in self.vertices:
-            lines.append('    <Vertex> %s { %f %f %f <Normal> { %f %f %f } <UV> { %f %f } }\n' %
-                         (str(i), v_tuple[0], v_tuple[1], v_tuple[2],
-                          n.X() != 'nan' or 0, n.Y() != 'nan' or 0, n.Z() != 'nan' or 0,
-                          t.U(), t.V()))
-
-        lines += '  } // End VertexPool: mesh\n'
-        print '* 100 %'
-        return lines
-
-    def write_polygons(self):
-        lines = []
-        for (group_name, group_polys) in self.polygons:
-            lines += "<Group> %s {\n" % (group_name, )
-            for (polygon, start_index, num_vertices) in group_polys:
-                refs = ' '.join([str(j) for j in range(start_index, start_index + num_vertices)])
-                if self.options["textures"] == True:
-                    polygon_trefs = ' '.join(
-                        "<TRef> {%s}" % texture_name for texture_name in self.materials[polygon.MaterialName()].textures)
-                else:
-                    polygon_trefs = ""
-                lines.append(
-                    "  <Polygon> {\n    %s\n    <MRef> { %s } \n    <VertexRef> { %s <Ref> { mesh } } \n}\n" % (
-                        polygon_trefs, polygon.MaterialName(), refs, ))
-            lines += "\n}\n"
-        print '* 100 %'
-        return lines
+        if cache is not None:
+            cache.save()
+            print cache.report()
+        # smoothing needs the whole figure to average normals across actor seams, it runs before the actors are
+        # split between workers
+        normals = None
+        if self.options["normal_angle"] is not None:
+            normals = figure_normals(snapshots, self.options["normal_angle"])
+        if self.manifest is not None:
+            # seam normals depend on the neighbouring actors, so they are part of the hash
+            self.actor_hashes = [(actor.InternalName(), actor_hash(snapshot, self.materials,
+                                                                   normals and normals[k][1]))
+                                 for k, (actor, snapshot) in enumerate(zip(actors, snapshots))]
+        # egg vertex index is different from poser, every actor gets its own contiguous range
+        result = collect_actors(snapshots, self.options["weld"], self.options["weld_epsilon"], self.options["workers"],
+                                self.pool, normals)
+        if export_morph:
+            morphs = result[3]
+            names = set([name for sliders in morphs.itervalues() for (name, delta) in sliders])
+            print 'Exporting %d morph sliders on %d vertices' % (len(names), len(morphs))
+        return result
 
     def collect_anims(self):
-        anims_data = {}
-        for frame in xrange(0, poser.Scene().NumFrames() - 1):
-        #for frame in xrange(0, 3):
-            poser.Scene().SetFrame(frame)
-            poser.Scene().DrawAll()
-            self.collect_anims2(self.joints, anims_data)
+        frames = xrange(0, poser.Scene().NumFrames() - 1)
+        anims_data = AnimStore(len(frames))
+        anims_data.add_joints(self.joints)
+        self.root_actor_name = self.figure.ParentActor().Name()
+        sampler = AnimationSampler(poser.Scene(), self.options["anim_redraw"])
+        sampler.sample(frames, lambda frame: self.collect_anims2(self.joints, anims_data, frame))
+        anims_data.convert_rotations()
+        print 'Sampled', sampler.report()
+        self.anim_frame_times = sampler.frame_times
         return anims_data
 
-    def collect_anims2(self, joint, anims):
+    def collect_anims2(self, joint, anims, frame):
         for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joint:
             #print "anims for %s" % joint_name
             #get bone displacement
-            displacement = actor.LocalDisplacement()
             origin = actor.Origin()
             parentOrigin = actor.Parent().Origin()
-            if actor.Name() == self.figure.ParentActor().Name():
+            if actor.Name() == self.root_actor_name:
                 parentOrigin = origin
-            displacement = vec_add(vec_subtract(origin, parentOrigin), displacement)
+            #displacement = vec_add(vec_subtract(origin, parentOrigin), actor.LocalDisplacement())
             displacement = vec_subtract(origin, parentOrigin)
-            # get rotation
+            # get rotation, converted to hpr for the whole take once sampling is done
             quat_tuple = actor.LocalQuaternion()
-            quat = Quaternion(quat_tuple[0], quat_tuple[1], quat_tuple[2], quat_tuple[3])
-            hpr = radians_to_degrees(quat.get_euler())
             #store displacement/rotation in anims data
-            if joint_name not in anims:
-                anims[joint_name] = []
-            anims[joint_name].append((displacement, hpr))
-            self.collect_anims2(child_joints, anims)
+            anims.set(joint_name, frame, displacement, quat_tuple)
+            self.collect_anims2(child_joints, anims, frame)
         return anims
 
-    def write_animation(self):
-        print 'Writing animation ...'
-        anims_data = self.collect_anims()
-        #print anims_data
-        #return
-        lines = []
-        lines += '<Table> {\n'
-        lines += indent_string('<Bundle> %s {\n' % self.figure_name, 1)
-        lines += indent_string('<Table> "<skeleton>" {\n', 2)
-        lines += self.write_animation_table(self.joints, anims_data, 3)
-        lines += indent_string('}\n', 2)
-        lines += indent_string('}\n', 1)
-        lines += '}'
-
-        return lines
-
-    def write_animation_table(self, joint, anims_data, indent=1):
-        lines = []
-        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joint:
-            #print joint_name
-            lines += indent_string('<Table> %s {\n' % joint_name, indent)
-            lines += indent_string('<Xfm$Anim> xform {\n', indent + 1)
-            lines += indent_string('<Scalar> order { sprht }\n', indent + 2)
-            lines += indent_string('<Scalar> contents { prhxyz }\n', indent + 2)
-            #lines += indent_string('<Scalar> contents { ijkprhxyz }\n', indent + 2)
-            lines += indent_string('<Scalar> fps { %u }\n' % 2, indent + 2)
-            lines += indent_string('<V> {\n', indent + 2)
-            for frame in xrange(0, poser.Scene().NumFrames() - 1):
-                displacement, hpr = anims_data[joint_name][frame]
-                #lines += indent_string("%s %s %s %s %s %s %s %s %s\n" %
-                lines += indent_string("%s %s %s %s %s %s\n" %
-                        (
-                            hpr[2], hpr[1], hpr[0],
-                            displacement[0], displacement[1], displacement[2]
-                        ),
-                    indent + 3)
-            lines += indent_string('}\n', indent + 2)
-            lines += indent_string('}\n', indent + 1)
-            lines += self.write_animation_table(child_joints, anims_data, indent + 2)
-            lines += indent_string('} // End table %s \n' % joint_name, indent)
-
-        return lines
+    def write_animation(self, writer):
+        with self.instrument.stage('collect_anims') as stage:
+            anims_data = self.collect_anims()
+            stage.items = anims_data.num_frames
+        # drop constant channels before writing
+        with self.instrument.stage('reduce_animation') as stage:
+            reducer = KeyframeReducer(self.options["anim_tolerance"])
+            channels = reducer.reduce(self.joints, anims_data)
+            print reducer.report()
+        precision = self.precision()
+        with self.instrument.stage('write_animation', writer) as stage:
+            writer.write_animation(self.figure_name, self.joints, channels, precision)
+            stage.items = len(channels)
+        if not precision.is_default():
+            values = [f for joint_channels in channels.values() for (channel, values) in joint_channels
+                      for f in values]
+            print precision.report([('animation', precision.bytes_saved('animation', values))])
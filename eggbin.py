@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+#
+# Binary egg intermediate (.p2eb) and its loader.
+#
+# BinaryEggWriter (writer.py) writes the same content as the text egg in a compact binary form, this module reads
+# it back into Panda3D EggData without any text parsing. It does not depend on poser and runs on Python 2 or 3, so
+# it can be used from the Panda3D side of the pipeline:
+#
+#   python eggbin.py figure.p2eb figure.bam     convert to BAM
+#   python eggbin.py figure.p2eb figure.egg     convert to a text egg
+#
+# or in code: NodePath(loadEggData(eggbin.load('figure.p2eb'))).
+#
+# Format, all numbers little-endian, strings are a uint16 length followed by the bytes:
+#
+#   magic 'P2EB', uint16 version
+#   records, each a one byte tag followed by its payload:
+#     'H' header       str figure name
+#     'M' material     str name, 7 float64 (diffuse rgb, specular rgb, shininess), uint8 count, str texture names
+#     'T' texture      str name, str filename, str envtype, uint8 alpha (texture is a pure alpha map)
+#     'G' group        str name, uint8 dart                                                  closed by 'E'
+#     'J' joint        str name, 16 float64 matrix (row major), str vertex pool, uint32 count,
+#                      uint32 vertex indices                                                  closed by 'E'
+#     'V' vertex pool  str name, uint32 count, count * 8 float32 (x y z nx ny nz u v)
+#     'N' tangents     str vertex pool name, uint32 count, count * 6 float32 (tangent xyz, binormal xyz), follows
+#                      the 'V' record of its pool when the egg has tangents
+#     'P' polygons     str group name, str vertex pool, uint8 textured, uint32 polygon count, uint32 length,
+#                      length uint32 values: per polygon material index (order of the 'M' records), vertex count
+#                      and vertex indices
+#     'A' anim bundle  str name, float64 fps                                                  closed by 'E'
+#     'K' joint table  str name, uint8 channels, per channel: one char name, uint32 count, float64 values
+#                                                                                             closed by 'E'
+#     'E' end of the innermost open group, joint, bundle or joint table
+#
+import sys
+import struct
+from array import array
+
+MAGIC = b'P2EB'
+VERSION = 1
+
+HEADER = b'H'
+MATERIAL = b'M'
+TEXTURE = b'T'
+GROUP = b'G'
+JOINT = b'J'
+VERTEX_POOL = b'V'
+TANGENTS = b'N'
+POLYGONS = b'P'
+BUNDLE = b'A'
+JOINT_TABLE = b'K'
+END = b'E'
+
+# records that open a level closed by END
+NESTED = (GROUP, JOINT, BUNDLE, JOINT_TABLE)
+
+VERTEX_SIZE = 8
+TANGENT_SIZE = 6
+
+
+def little_endian(arr):
+    # arrays are stored little-endian, swap in place on big-endian machines
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+# One record of the file, nested records are in children
+class Record:
+    def __init__(self, tag, **fields):
+        self.tag = tag
+        self.children = []
+        self.__dict__.update(fields)
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def string(self):
+        length, = self.unpack('<H')
+        s = self.data[self.pos:self.pos + length]
+        self.pos += length
+        if not isinstance(s, str):
+            s = s.decode('latin-1')
+        # names are stored the way the text egg quotes them
+        return s.strip('"')
+
+    def array(self, typecode, count):
+        arr = array(typecode)
+        end = self.pos + arr.itemsize * count
+        if hasattr(arr, 'frombytes'):
+            arr.frombytes(self.data[self.pos:end])
+        else:
+            arr.fromstring(self.data[self.pos:end])
+        self.pos = end
+        return little_endian(arr)
+
+    def record(self, tag):
+        if tag == HEADER:
+            return Record(tag, name=self.string())
+        if tag == MATERIAL:
+            name = self.string()
+            values = self.unpack('<7d')
+            count, = self.unpack('<B')
+            return Record(tag, name=name, diffuse=values[0:3], specular=values[3:6], shininess=values[6],
+                          textures=[self.string() for i in range(count)])
+        if tag == TEXTURE:
+            name, filename, envtype = self.string(), self.string(), self.string()
+            alpha, = self.unpack('<B')
+            return Record(tag, name=name, filename=filename, envtype=envtype, alpha=bool(alpha))
+        if tag == GROUP:
+            name = self.string()
+            dart, = self.unpack('<B')
+            return Record(tag, name=name, dart=bool(dart))
+        if tag == JOINT:
+            name = self.string()
+            matrix = self.unpack('<16d')
+            pool = self.string()
+            count, = self.unpack('<I')
+            return Record(tag, name=name, matrix=matrix, pool=pool, refs=self.array('I', count))
+        if tag == VERTEX_POOL:
+            name = self.string()
+            count, = self.unpack('<I')
+            return Record(tag, name=name, count=count, data=self.array('f', count * VERTEX_SIZE))
+        if tag == TANGENTS:
+            name = self.string()
+            count, = self.unpack('<I')
+            return Record(tag, name=name, count=count, data=self.array('f', count * TANGENT_SIZE))
+        if tag == POLYGONS:
+            name, pool = self.string(), self.string()
+            textured, count, length = self.unpack('<BII')
+            return Record(tag, name=name, pool=pool, textured=bool(textured), count=count,
+                          data=self.array('I', length))
+        if tag == BUNDLE:
+            name = self.string()
+            fps, = self.unpack('<d')
+            return Record(tag, name=name, fps=fps)
+        if tag == JOINT_TABLE:
+            name = self.string()
+            num_channels, = self.unpack('<B')
+            channels = []
+            for i in range(num_channels):
+                channel = self.data[self.pos:self.pos + 1]
+                self.pos += 1
+                if not isinstance(channel, str):
+                    channel = channel.decode('latin-1')
+                count, = self.unpack('<I')
+                channels.append((channel, self.array('d', count)))
+            return Record(tag, name=name, channels=channels)
+        raise ValueError('unknown record %r at offset %d' % (tag, self.pos - 1))
+
+
+def read(filename):
+    # parse a .p2eb file into a tree of Records
+    f = open(filename, 'rb')
+    data = f.read()
+    f.close()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a binary egg' % filename)
+    reader = Reader(data)
+    reader.pos = len(MAGIC)
+    version, = reader.unpack('<H')
+    if version != VERSION:
+        raise ValueError('%s has unsupported version %d' % (filename, version))
+    root = Record(None)
+    stack = [root]
+    while reader.pos < len(data):
+        tag = data[reader.pos:reader.pos + 1]
+        reader.pos += 1
+        if tag == END:
+            stack.pop()
+            continue
+        record = reader.record(tag)
+        stack[-1].children.append(record)
+        if tag in NESTED:
+            stack.append(record)
+    if len(stack) != 1:
+        raise ValueError('%s is truncated' % filename)
+    return root
+
+
+def iter_records(record):
+    for child in record.children:
+        yield child
+        for r in iter_records(child):
+            yield r
+
+
+def to_egg_data(root):
+    # build Panda3D EggData from a tree returned by read()
+    from panda3d.core import CS_yup_right, Filename, LMatrix4d, LPoint3d, LVector3d, LPoint2d, LVecBase4, LNormald
+    from panda3d.egg import EggData, EggComment, EggGroup, EggMaterial, EggTexture, EggVertexPool, EggVertex, \
+        EggVertexUV, EggPolygon, EggTable, EggXfmSAnim, EggSAnimData
+
+    data = EggData()
+    data.setCoordinateSystem(CS_yup_right)
+    materials = []
+    textures = {}
+    # joints reference vertices before the pool record, so all pools are filled up front
+    pools = {}
+    for record in iter_records(root):
+        if record.tag == VERTEX_POOL:
+            pool = EggVertexPool(record.name)
+            values = record.data
+            for i in range(record.count):
+                o = i * VERTEX_SIZE
+                vertex = EggVertex()
+                vertex.setPos(LPoint3d(values[o], values[o + 1], values[o + 2]))
+                vertex.setNormal(LVector3d(values[o + 3], values[o + 4], values[o + 5]))
+                vertex.setUv(LPoint2d(values[o + 6], values[o + 7]))
+                pool.addVertex(vertex, i)
+            pools[record.name] = pool
+        elif record.tag == TANGENTS:
+            pool = pools[record.name]
+            values = record.data
+            for i in range(record.count):
+                o = i * TANGENT_SIZE
+                vertex = pool.getVertex(i)
+                uv = EggVertexUV('', vertex.getUv())
+                uv.setTangent(LNormald(values[o], values[o + 1], values[o + 2]))
+                uv.setBinormal(LNormald(values[o + 3], values[o + 4], values[o + 5]))
+                vertex.setUvObj(uv)
+
+    def build(record, parent, fps=None):
+        node = None
+        if record.tag == HEADER:
+            node = EggComment('', 'poser2egg - ' + record.name)
+        elif record.tag == MATERIAL:
+            node = EggMaterial(record.name)
+            node.setDiff(LVecBase4(record.diffuse[0], record.diffuse[1], record.diffuse[2], 1))
+            node.setSpec(LVecBase4(record.specular[0], record.specular[1], record.specular[2], 1))
+            node.setShininess(record.shininess)
+            materials.append((node, record.textures))
+        elif record.tag == TEXTURE:
+            node = EggTexture(record.name, Filename(record.filename))
+            if record.alpha:
+                node.setFormat(EggTexture.F_alpha)
+            node.setEnvType(EggTexture.stringEnvType(record.envtype))
+            node.setWrapMode(EggTexture.WM_repeat)
+            textures[record.name] = node
+        elif record.tag == GROUP:
+            node = EggGroup(record.name)
+            if record.dart:
+                node.setDartType(EggGroup.DT_structured)
+        elif record.tag == JOINT:
+            node = EggGroup(record.name)
+            node.setGroupType(EggGroup.GT_joint)
+            node.setTransform3d(LMatrix4d(*record.matrix))
+            pool = pools[record.pool]
+            for i in record.refs:
+                node.refVertex(pool.getVertex(i), 1.0)
+        elif record.tag == VERTEX_POOL:
+            node = pools[record.name]
+        elif record.tag == TANGENTS:
+            # applied to the pool up front
+            return
+        elif record.tag == POLYGONS:
+            node = EggGroup(record.name)
+            pool = pools[record.pool]
+            values = record.data
+            o = 0
+            for i in range(record.count):
+                material, material_textures = materials[values[o]]
+                polygon = EggPolygon()
+                if record.textured:
+                    for texture_name in material_textures:
+                        polygon.addTexture(textures[texture_name])
+                polygon.setMaterial(material)
+                for j in values[o + 2:o + 2 + values[o + 1]]:
+                    polygon.addVertex(pool.getVertex(j))
+                o += 2 + values[o + 1]
+                node.addChild(polygon)
+        elif record.tag == BUNDLE:
+            node = EggTable()
+            bundle = EggTable(record.name)
+            bundle.setTableType(EggTable.TT_bundle)
+            skeleton = EggTable('<skeleton>')
+            node.addChild(bundle)
+            bundle.addChild(skeleton)
+            for child in record.children:
+                build(child, skeleton, record.fps)
+            parent.addChild(node)
+            return
+        elif record.tag == JOINT_TABLE:
+            node = EggTable(record.name)
+            xform = EggXfmSAnim('xform', CS_yup_right)
+            xform.setOrder('sprht')
+            xform.setFps(fps)
+            for channel, values in record.channels:
+                table = EggSAnimData(channel)
+                for v in values:
+                    table.addData(v)
+                xform.addChild(table)
+            node.addChild(xform)
+        parent.addChild(node)
+        for child in record.children:
+            build(child, node, fps)
+
+    for record in root.children:
+        build(record, data)
+    return data
+
+
+def load(filename):
+    return to_egg_data(read(filename))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python eggbin.py figure.p2eb (figure.bam | figure.egg)')
+    from panda3d.core import Filename, NodePath
+    from panda3d.egg import loadEggData
+    egg_data = load(sys.argv[1])
+    output = Filename.fromOsSpecific(sys.argv[2])
+    if output.getExtension() == 'egg':
+        egg_data.writeEgg(output)
+    else:
+        NodePath(loadEggData(egg_data)).writeBamFile(output)
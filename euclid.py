@@ -1550,6 +1550,99 @@ class Quaternion:
         return Q
     new_interpolate = classmethod(new_interpolate)
 
+# Batch conversion
+# ---------------------------------------------------------------------------
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+def _euler_degrees_python(ws, xs, ys, zs):
+    # Same arithmetic as Quaternion.get_euler followed by degree conversion,
+    # without building a Quaternion per sample.
+    atan2, asin, pi = math.atan2, math.asin, math.pi
+    headings, attitudes, banks = [], [], []
+    for w, x, y, z in zip(ws, xs, ys, zs):
+        t = x * y + z * w
+        if t > 0.4999:
+            heading = 2 * atan2(x, w)
+            attitude = pi / 2
+            bank = 0
+        elif t < -0.4999:
+            heading = -2 * atan2(x, w)
+            attitude = -pi / 2
+            bank = 0
+        else:
+            sqx = x ** 2
+            sqy = y ** 2
+            sqz = z ** 2
+            heading = atan2(2 * y * w - 2 * x * z, 1 - 2 * sqy - 2 * sqz)
+            attitude = asin(2 * t)
+            bank = atan2(2 * x * w - 2 * y * z, 1 - 2 * sqx - 2 * sqz)
+        headings.append(heading * 180 / pi)
+        attitudes.append(attitude * 180 / pi)
+        banks.append(bank * 180 / pi)
+    return headings, attitudes, banks
+
+def _euler_degrees_numpy(ws, xs, ys, zs):
+    np = _numpy
+    w = np.asarray(ws, dtype=np.float64)
+    x = np.asarray(xs, dtype=np.float64)
+    y = np.asarray(ys, dtype=np.float64)
+    z = np.asarray(zs, dtype=np.float64)
+    t = x * y + z * w
+    north = t > 0.4999
+    south = t < -0.4999
+    # x ** 2 in Python goes through libm pow, which is not always x * x
+    two = np.full_like(x, 2.0)
+    sqx = np.power(x, two)
+    sqy = np.power(y, two)
+    sqz = np.power(z, two)
+    old = np.seterr(invalid='ignore')
+    try:
+        pole = np.arctan2(x, w)
+        heading = np.where(north, 2 * pole, np.where(south, -2 * pole,
+                           np.arctan2(2 * y * w - 2 * x * z, 1 - 2 * sqy - 2 * sqz)))
+        attitude = np.where(north, math.pi / 2, np.where(south, -math.pi / 2,
+                            np.arcsin(2 * t)))
+        bank = np.where(north | south, 0.0,
+                        np.arctan2(2 * x * w - 2 * y * z, 1 - 2 * sqx - 2 * sqz))
+    finally:
+        np.seterr(**old)
+    return ((heading * 180 / math.pi).tolist(),
+            (attitude * 180 / math.pi).tolist(),
+            (bank * 180 / math.pi).tolist())
+
+def _numpy_matches_python():
+    # Vectorized trig may differ from libm in the last bit on some builds;
+    # only use NumPy where it reproduces Quaternion.get_euler exactly.
+    import random
+    rnd = random.Random(1)
+    quats = [Quaternion(rnd.uniform(-1, 1), rnd.uniform(-1, 1),
+                        rnd.uniform(-1, 1), rnd.uniform(-1, 1)).normalized()
+             for i in range(256)]
+    quats += [Quaternion.new_rotate_axis(a * 0.5, Vector3(0, 0, 1))
+              for a in range(-7, 8)]
+    columns = ([q.w for q in quats], [q.x for q in quats],
+               [q.y for q in quats], [q.z for q in quats])
+    return _euler_degrees_numpy(*columns) == _euler_degrees_python(*columns)
+
+def quaternions_to_euler_degrees(ws, xs, ys, zs):
+    '''Convert a batch of quaternions to (heading, attitude, bank) in degrees.
+
+    The quaternions are given as four equally long sequences of their w, x, y
+    and z components; three lists of floats are returned.  Results are
+    bit-compatible with ``Quaternion.get_euler`` converted to degrees as
+    ``rads * 180 / math.pi``.  NumPy is used when it is installed and
+    reproduces those results, otherwise a pure Python loop.
+    '''
+    if _use_numpy_euler:
+        return _euler_degrees_numpy(ws, xs, ys, zs)
+    return _euler_degrees_python(ws, xs, ys, zs)
+
+_use_numpy_euler = _numpy is not None and _numpy_matches_python()
+
 # Geometry
 # Much maths thanks to Paul Bourke, http://astronomy.swin.edu.au/~pbourke
 # ---------------------------------------------------------------------------
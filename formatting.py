@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+
+
+VERTEX_ROW = '    <Vertex> %%d { %(p)s %(p)s %(p)s <Normal> { %(n)s %(n)s %(n)s } <UV> { %(u)s %(u)s } }\n'
+TBN_VERTEX_ROW = ('    <Vertex> %%d { %(p)s %(p)s %(p)s <Normal> { %(n)s %(n)s %(n)s } '
+                  '<UV> { %(u)s %(u)s <Tangent> { %(n)s %(n)s %(n)s } <Binormal> { %(n)s %(n)s %(n)s } } }\n')
+
+# end every float of a vertex block formatted for strip_zeros, in place of the space that follows it; floats
+# without decimals or without a precision setting get their own mark so their zeros are left alone
+END_MARK = '\x01'
+PLAIN_MARK = '\x02'
+
+
+def strip_zeros(s):
+    # one %.Nf formatted value without trailing zeros: 0.500000 -> 0.5, 1.000000 -> 1, -0.000000 -> 0
+    if '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    if s == '-0':
+        return '0'
+    return s
+
+
+class Precision:
+    """
+    Decimals written for every kind of float in the egg: vertex positions, normals (with tangents and binormals),
+    uvs, material colors, joint matrices and animation channels. None keeps the formatting from before precision
+    settings (%f for vertex data and materials, str() for matrices and animation). With strip_zeros values are
+    rounded to their decimals and written without trailing zeros (0.5 instead of 0.500000, 1 instead of 1.000000).
+    """
+    ATTRIBUTES = ('position', 'normal', 'uv', 'material', 'matrix', 'animation')
+    DEFAULTS = {'position': 6, 'normal': 6, 'uv': 6, 'material': 6, 'matrix': None, 'animation': None}
+    LEGACY_FORMATS = {'position': '%f', 'normal': '%f', 'uv': '%f', 'material': '%f', 'matrix': '%s',
+                      'animation': '%s'}
+    # values sampled for the bytes saved estimate
+    SAMPLE_SIZE = 5000
+
+    def __init__(self, digits=None, strip_zeros=False):
+        # digits is one number for all attributes or a dict of attribute -> decimals
+        self.digits = dict(self.DEFAULTS)
+        if isinstance(digits, dict):
+            self.digits.update(digits)
+        elif digits is not None:
+            self.digits = dict([(attribute, digits) for attribute in self.ATTRIBUTES])
+        self.strip_zeros = strip_zeros
+
+    def is_default(self):
+        return self.digits == self.DEFAULTS and not self.strip_zeros
+
+    def float_format(self, attribute):
+        # with strip_zeros the formatted text goes through strip_zeros()
+        digits = self.digits[attribute]
+        if digits is None:
+            return self.LEGACY_FORMATS[attribute]
+        return '%%.%df' % digits
+
+    def formatter(self, attribute):
+        # float -> string function for one attribute
+        digits = self.digits[attribute]
+        if digits is None:
+            if self.LEGACY_FORMATS[attribute] == '%s':
+                return str
+            return self.LEGACY_FORMATS[attribute].__mod__
+        if self.strip_zeros:
+            format_float = ('%%.%df' % digits).__mod__
+            return lambda f: strip_zeros(format_float(f))
+        return ('%%.%df' % digits).__mod__
+
+    def bytes_saved(self, attribute, values, total=None):
+        """
+        Bytes the settings for attribute save on values compared to the formatting before precision settings.
+        Long value lists are sampled, total is the number of values the sample stands for.
+        """
+        values = list(values)
+        if total is None:
+            total = len(values)
+        if not values:
+            return 0
+        sample = values[::max(1, len(values) // self.SAMPLE_SIZE)]
+        legacy = Precision().formatter(attribute)
+        current = self.formatter(attribute)
+        saved = sum([len(legacy(f)) - len(current(f)) for f in sample])
+        return int(saved * float(total) / len(sample))
+
+    def report(self, savings):
+        # savings is a list of (attribute, bytes saved)
+        return 'precision saved %d bytes (%s)' % (sum([saved for attribute, saved in savings]),
+                                                   ', '.join(['%s %d' % item for item in savings]))
+
+
+class VertexFormatter:
+    """
+    Formats the vertex pool a block of vertices at a time: a template for the whole block is built once and filled
+    with a single % operation on the flat values, instead of a format and a str() call per vertex. Floats follow
+    the Precision settings, with strip_zeros the trailing zeros of the whole block are stripped at once. Morph
+    slider deltas are spliced into the rows of the few vertices they move.
+    """
+    BLOCK_SIZE = 1024
+
+    def __init__(self, precision=None, block_size=BLOCK_SIZE):
+        self.precision = precision or Precision()
+        self.block_size = block_size
+        attributes = {'p': 'position', 'n': 'normal', 'u': 'uv'}
+        formats = dict([(key, self.precision.float_format(attribute)) for key, attribute in attributes.items()])
+        self.zero_runs = None
+        if self.precision.strip_zeros:
+            # zeros are only stripped in front of END_MARK, so never from vertex indices
+            digits = dict([(key, self.precision.digits[attribute]) for key, attribute in attributes.items()])
+            for key in formats:
+                formats[key] += digits[key] and END_MARK or PLAIN_MARK
+            # one pass per power of two up to the decimals (runs of 4, 2 and 1 zeros for 6) strips any count of
+            # trailing zeros
+            length = 1
+            while length * 2 <= max([d or 0 for d in digits.values()]):
+                length *= 2
+            self.zero_runs = []
+            while length:
+                self.zero_runs.append('0' * length + END_MARK)
+                length //= 2
+        self.rows = dict([(tbn, (row % formats).replace(END_MARK + ' ', END_MARK).replace(PLAIN_MARK + ' ',
+                                                                                            PLAIN_MARK))
+                          for tbn, row in ((False, VERTEX_ROW), (True, TBN_VERTEX_ROW))])
+        self.templates = dict([(tbn, row * block_size) for tbn, row in self.rows.items()])
+
+    def _strip_zeros(self, text):
+        # a handful of str.replace passes over the whole block instead of Python work per value; -0 can only be a
+        # whole value
+        for run in self.zero_runs:
+            text = text.replace(run, END_MARK)
+        text = text.replace('.' + END_MARK, END_MARK).replace(PLAIN_MARK, END_MARK)
+        return text.replace('-0' + END_MARK, '0' + END_MARK).replace(END_MARK, ' ')
+
+    def _values(self, start, vertices, tangents):
+        # flat tuple of vertex index and attribute values of one block
+        values = []
+        append, extend = values.append, values.extend
+        i = start
+        if tangents is None:
+            for (v_tuple, n, t) in vertices:
+                append(i)
+                extend(v_tuple)
+                extend(n)
+                extend(t)
+                i += 1
+        else:
+            for (v_tuple, n, t), (tan, bi) in zip(vertices, tangents):
+                append(i)
+                extend(v_tuple)
+                extend(n)
+                extend(t)
+                extend(tan)
+                extend(bi)
+                i += 1
+        return tuple(values)
+
+    def _add_morphs(self, text, start, morphs, moved):
+        # insert <Dxyz> entries before the closing brace of the rows of vertices in moved
+        format_float = self.precision.formatter('position')
+        rows = text.split('\n')
+        for i in moved:
+            entries = ' '.join(['<Dxyz> %s { %s %s %s }' % ((name, ) + tuple(map(format_float, delta)))
+                                for (name, delta) in morphs[i]])
+            rows[i - start] = '%s %s }' % (rows[i - start][:-2], entries)
+        return '\n'.join(rows)
+
+    def blocks(self, vertices, tangents=None, morphs=None, first=0, last=None):
+        # morphs is {vertex index: [(morph name, (dx, dy, dz))]} as returned by collect_actors(), first and last
+        # limit the output to a range of vertices
+        tbn = tangents is not None
+        size = self.block_size
+        moved = sorted(morphs or ())
+        if last is None:
+            last = len(vertices)
+        for start in xrange(first, last, size):
+            end = min(start + size, last)
+            block = vertices[start: end]
+            if len(block) == size:
+                template = self.templates[tbn]
+            else:
+                template = self.rows[tbn] * len(block)
+            text = template % self._values(start, block, tbn and tangents[start: end] or None)
+            if self.zero_runs is not None:
+                text = self._strip_zeros(text)
+            if moved:
+                block_moved = moved[bisect_left(moved, start): bisect_left(moved, start + len(block))]
+                if block_moved:
+                    text = self._add_morphs(text, start, morphs, block_moved)
+            yield text
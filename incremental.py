@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Incremental re-export. Every text egg export can leave a manifest next to the egg (figure.egg.manifest) with a
+# content hash per actor and the byte ranges of its vertex pool rows and polygon group. The next incremental
+# export to the same file copies those ranges from the previous egg for actors whose hash and first vertex index
+# are unchanged, and formats only the dirty actors. The result is byte for byte the egg a full export writes.
+#
+import os
+import json
+import hashlib
+from array import array
+
+# EggObject options that change the formatted vertex pool or polygons, a manifest written with other values is
+# not reused
+OUTPUT_OPTIONS = ('morph', 'morph_threshold', 'textures', 'weld', 'weld_epsilon', 'normal_angle', 'tbn',
+                  'precision', 'strip_zeros', 'sort_polygons', 'material_groups')
+MANIFEST_VERSION = 1
+
+
+def manifest_path(filename):
+    return filename + '.manifest'
+
+
+def supports(filename):
+    # blocks are copied by byte offset, which only works on plain text eggs
+    return filename.lower().endswith('.egg')
+
+
+def _flat(values):
+    # list of float tuples or a NumPy array -> bytes
+    if hasattr(values, 'tostring'):
+        return values.tostring()
+    return array('d', [f for v in values for f in v]).tostring()
+
+
+def actor_hash(snapshot, materials, corner_normals=None):
+    """
+    Content hash of an ActorSnapshot: geometry, uvs, normals, the values and deltas of the morphs it bakes or
+    exports and the textures of the materials its polygons use (they end up in the polygon <TRef>s). Smoothed
+    corner_normals from mesh.figure_normals() also depend on the neighbouring actors and are hashed when given.
+    """
+    h = hashlib.sha1()
+    h.update(snapshot.group_name)
+    h.update(_flat(snapshot.positions))
+    for value, deltas in snapshot.morphs:
+        h.update(repr(value))
+        h.update(_flat(deltas))
+    for name, deltas in snapshot.sliders:
+        h.update(name)
+        h.update(repr(sorted(deltas.items())))
+    h.update(_flat(snapshot.normals))
+    if corner_normals is not None:
+        # degenerate corners (None) keep the poser normal, hashed above
+        h.update(_flat([n or (0.0, 0.0, 0.0) for n in corner_normals]))
+    h.update(_flat(snapshot.uvs))
+    h.update(repr(snapshot.polygons))
+    h.update(snapshot.sets.tostring())
+    h.update(repr(snapshot.tex_polygons))
+    h.update(snapshot.tex_sets.tostring())
+    for material_name in sorted(set([material for (start, num_vertices, material) in snapshot.polygons])):
+        material = materials.get(material_name)
+        h.update(repr((material_name, material is not None and material.textures or None)))
+    return h.hexdigest()
+
+
+# Hashes and byte ranges of the blocks of every actor in one egg
+class ExportManifest:
+    def __init__(self, options):
+        # JSON round trip, so a loaded manifest compares equal to a fresh one
+        self.options = json.loads(json.dumps(dict([(name, options[name]) for name in OUTPUT_OPTIONS])))
+        # actor name -> {'hash': ..., 'first': first egg vertex, block kind: [start byte, end byte]}
+        self.actors = {}
+
+    def add(self, actor_name, content_hash, first, kind, start, end):
+        entry = self.actors.setdefault(actor_name, {'hash': content_hash, 'first': first})
+        entry[kind] = [start, end]
+
+    def save(self, filename):
+        f = open(filename, 'w')
+        try:
+            json.dump({'version': MANIFEST_VERSION, 'options': self.options, 'actors': self.actors}, f)
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, filename):
+        f = open(filename)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        if data.get('version') != MANIFEST_VERSION:
+            return None
+        manifest = cls(data['options'])
+        manifest.actors = data['actors']
+        return manifest
+
+
+class PreviousExport:
+    """
+    The egg and manifest of the last export to a file. open() moves the egg aside to filename.prev so the new
+    export can be written under the old name, and removes the manifest: if the export fails half way, the next
+    one starts over instead of copying from a broken egg.
+    """
+    def __init__(self, filename, manifest):
+        self.filename = filename
+        self.manifest = manifest
+        self.file = open(filename, 'rb')
+        self.reused = 0
+
+    @classmethod
+    def open(cls, filename):
+        # None when there is nothing usable to reuse
+        manifest_file = manifest_path(filename)
+        if not supports(filename) or not os.path.exists(filename) or not os.path.exists(manifest_file):
+            return None
+        try:
+            manifest = ExportManifest.load(manifest_file)
+        except (IOError, ValueError, KeyError):
+            manifest = None
+        os.remove(manifest_file)
+        if manifest is None:
+            return None
+        previous = filename + '.prev'
+        if os.path.exists(previous):
+            os.remove(previous)
+        os.rename(filename, previous)
+        return cls(previous, manifest)
+
+    def matches(self, options):
+        return self.manifest.options == ExportManifest(options).options
+
+    def block(self, actor_name, content_hash, first, kind):
+        # text of a block of the previous egg, None when the actor changed or moved in the vertex pool
+        entry = self.manifest.actors.get(actor_name)
+        if entry is None or entry['hash'] != content_hash or entry['first'] != first or kind not in entry:
+            return None
+        start, end = entry[kind]
+        self.file.seek(start)
+        text = self.file.read(end - start)
+        # offsets are file positions, text mode files on windows store newlines as \r\n
+        if os.linesep != '\n':
+            text = text.replace(os.linesep, '\n')
+        self.reused += 1
+        return text
+
+    def close(self):
+        self.file.close()
+        os.remove(self.filename)
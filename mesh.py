@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from itertools import imap, izip
+
+from utils import *
+from morphs import vertex_positions, morph_deltas, sparse_deltas, bake_morphs
+from normals import smooth_normals
+from morphcache import geometry_fingerprint
+
+
+# Welds polygon corners of one actor into shared egg vertices. Corners are keyed on (position, normal, uv); with a
+# non-zero epsilon the floats are snapped to that grid first, so nearly identical corners are merged as well.
+# Corners added with a source poser vertex only weld with corners of that same vertex and material: morph deltas
+# stay per vertex, and Panda3D asserts on load when a morphed vertex is shared by polygons of different materials.
+class VertexIndex:
+    def __init__(self, epsilon=0.0):
+        self.epsilon = epsilon
+        # egg vertices as plain (position, normal, uv) tuples
+        self.vertices = []
+        # egg vertex index -> source poser vertex of the corners added with one
+        self.sources = {}
+        self._index = {}
+
+    def _key(self, position, normal, uv):
+        values = position + normal + uv
+        if self.epsilon:
+            scale = 1.0 / self.epsilon
+            values = tuple([int(round(f * scale)) for f in values])
+        return values
+
+    def add(self, position, normal, uv, source=None, material=None):
+        key = self._key(position, normal, uv)
+        if source is not None:
+            key += (source, material)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.vertices)
+            self._index[key] = index
+            self.vertices.append((position, normal, uv))
+            if source is not None:
+                self.sources[index] = source
+        return index
+
+    def append(self, position, normal, uv, source=None, material=None):
+        # add a vertex without welding it to anything
+        self.vertices.append((position, normal, uv))
+        if source is not None:
+            self.sources[len(self.vertices) - 1] = source
+        return len(self.vertices) - 1
+
+    def __len__(self):
+        return len(self.vertices)
+
+
+# Plain copy of the geometry of one actor. It is taken on the main thread, where Poser can be called, and holds
+# only lists and arrays so it can be processed in another process.
+class ActorSnapshot:
+    def __init__(self, actor_index, group_name, positions, morphs, normals, uvs, polygons, sets, tex_polygons,
+                 tex_sets, sliders=()):
+        self.actor_index = actor_index
+        self.group_name = group_name
+        # vertex_positions() of the actor and the (value, deltas) of every morph to bake
+        self.positions = positions
+        self.morphs = morphs
+        # per poser vertex (x, y, z) and per poser texture vertex (u, v)
+        self.normals = normals
+        self.uvs = uvs
+        # (start in sets, number of vertices, material name) and (start in tex_sets, number of tex vertices)
+        self.polygons = polygons
+        self.sets = sets
+        self.tex_polygons = tex_polygons
+        self.tex_sets = tex_sets
+        # (morph name, sparse_deltas()) of every morph to export as a slider
+        self.sliders = sliders
+
+
+def snapshot_actor(actor_index, actor, morphs, sliders=(), slider_threshold=0.0, cache=None, figure_name=''):
+    geom = actor.Geometry()
+    vertices = geom.Vertices()
+    positions = vertex_positions(vertices)
+    sets = array('l', geom.Sets())
+    # delta tables come from the MorphCache when one is passed in
+    if cache is not None:
+        fingerprint = geometry_fingerprint(len(vertices), sets)
+        deltas = lambda morph: cache.deltas(figure_name, actor, morph, len(vertices), fingerprint)
+    else:
+        deltas = lambda morph: morph_deltas(morph, len(vertices))
+    morphs = [(morph.Value(), deltas(morph)) for morph in morphs]
+    sliders = [(fix_name(morph.Name()), sparse_deltas(deltas(morph), slider_threshold)) for morph in sliders]
+    normals = [(nan_to_zero(n.X()), nan_to_zero(n.Y()), nan_to_zero(n.Z())) for n in geom.Normals()]
+    uvs = [(t.U(), t.V()) for t in geom.TexVertices()]
+    polygons = [(p.Start(), p.NumVertices(), p.MaterialName()) for p in geom.Polygons()]
+    tex_polygons = [(p.Start(), p.NumTexVertices()) for p in geom.TexPolygons()]
+    return ActorSnapshot(actor_index, fix_name(actor.Name()), positions, morphs, normals, uvs, polygons,
+                         sets, tex_polygons, array('l', geom.TexSets()), sliders)
+
+
+def figure_normals(snapshots, angle):
+    """
+    Smoothed normals of the polygon corners of all actors, see smooth_normals(). Vertices are pooled by their baked
+    position across actors, like egg-trans -nv pools the whole egg, so the seams between body parts are smoothed
+    as well. Returns a (baked positions, corner normals) pair per snapshot, to be passed on to process_actor().
+    """
+    pooled = {}
+    positions = []
+    polygons = []
+    sets = array('l')
+    actor_positions = []
+    for snapshot in snapshots:
+        baked = bake_morphs(snapshot.positions, snapshot.morphs)
+        actor_positions.append(baked)
+        ids = []
+        for p in baked:
+            i = pooled.get(p)
+            if i is None:
+                i = pooled[p] = len(positions)
+                positions.append(p)
+            ids.append(i)
+        offset = len(sets)
+        polygons.extend([(offset + start, num_vertices, material)
+                         for (start, num_vertices, material) in snapshot.polygons])
+        sets.extend([ids[v] for v in snapshot.sets])
+    normals = smooth_normals(positions, polygons, sets, angle)
+    result = []
+    corner = 0
+    for snapshot, baked in zip(snapshots, actor_positions):
+        num_corners = sum([num_vertices for (start, num_vertices, material) in snapshot.polygons])
+        result.append((baked, normals[corner: corner + num_corners]))
+        corner += num_corners
+    return result
+
+
+def process_actor(snapshot, weld=True, epsilon=0.0, positions=None, corner_normals=None):
+    """
+    Turn an actor snapshot into egg data: bake morphs, expand polygon corners and weld them. positions and
+    corner_normals come from figure_normals() and replace the baked positions and the Poser normals. Returns the
+    actor vertices as (position, normal, uv) tuples, its polygons as (material name, vertex indices) and the slider
+    deltas of the vertices morphs move as {vertex index: [(morph name, (dx, dy, dz))]}, with indices local to the
+    actor.
+    """
+    if positions is None:
+        positions = bake_morphs(snapshot.positions, snapshot.morphs)
+    normals, uvs, sets, tex_sets = snapshot.normals, snapshot.uvs, snapshot.sets, snapshot.tex_sets
+    # sliders of every poser vertex a morph moves, only those corners are kept apart by their source vertex
+    vertex_sliders = {}
+    for name, deltas in snapshot.sliders:
+        for v, delta in deltas.iteritems():
+            vertex_sliders.setdefault(v, []).append((name, delta))
+    index = VertexIndex(epsilon)
+    add = index.add if weld else index.append
+    polygons = []
+    corner = 0
+    for (start, num_vertices, material), (tex_start, num_tex_vertices) in zip(snapshot.polygons,
+                                                                               snapshot.tex_polygons):
+        tex_set = tex_sets[tex_start: tex_start + num_tex_vertices]
+        if corner_normals is None:
+            refs = [add(positions[v], normals[v], uvs[tex_set[k]], v if v in vertex_sliders else None, material)
+                    for k, v in enumerate(sets[start: start + num_vertices])]
+        else:
+            # corners around degenerate polygons keep the poser normal
+            refs = [add(positions[v], corner_normals[corner + k] or normals[v], uvs[tex_set[k]],
+                        v if v in vertex_sliders else None, material)
+                    for k, v in enumerate(sets[start: start + num_vertices])]
+            corner += num_vertices
+        polygons.append((material, refs))
+    morphs = dict([(i, vertex_sliders[v]) for i, v in index.sources.iteritems()])
+    return index.vertices, polygons, morphs
+
+
+def _process_actor_job(job):
+    return process_actor(*job)
+
+
+def collect_actors(snapshots, weld=True, epsilon=0.0, workers=0, pool=None, normals=None):
+    """
+    Process actor snapshots, in a pool of worker processes when workers > 0 or a pool is passed in, and stitch the
+    results into one vertex pool. Every actor gets a contiguous range of egg vertex indices in snapshot order.
+    normals is the result of figure_normals() to use smoothed normals. Returns the vertex list,
+    [(group name, [(material name, vertex indices)])], {actor index: egg vertex indices} and the slider deltas
+    {egg vertex index: [(morph name, (dx, dy, dz))]}.
+    """
+    if normals is None:
+        normals = [(None, None)] * len(snapshots)
+    jobs = [(snapshot, weld, epsilon) + actor_normals for snapshot, actor_normals in zip(snapshots, normals)]
+    own_pool = pool is None and workers
+    if own_pool:
+        try:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers)
+        except (ImportError, OSError), e:
+            print 'Worker pool unavailable (%s), collecting in process' % e
+    if pool is not None:
+        results = pool.imap(_process_actor_job, jobs)
+    else:
+        results = imap(_process_actor_job, jobs)
+    egg_vertices = []
+    egg_polygons = []
+    actor_vertices = {}
+    egg_morphs = {}
+    for snapshot, (vertices, polygons, morphs) in izip(snapshots, results):
+        offset = len(egg_vertices)
+        egg_vertices.extend(vertices)
+        egg_polygons.append((snapshot.group_name,
+                             [(material, [offset + i for i in refs]) for (material, refs) in polygons]))
+        actor_vertices[snapshot.actor_index] = range(offset, len(egg_vertices))
+        for i, sliders in morphs.iteritems():
+            egg_morphs[offset + i] = sliders
+    if own_pool and pool is not None:
+        pool.close()
+        pool.join()
+    return egg_vertices, egg_polygons, actor_vertices, egg_morphs
+
+
+def sort_polygons(polygons):
+    """
+    Bucket the polygons of every group by material, so polygons of one material follow each other. Materials keep
+    the order of their first polygon and polygons their order within a material. polygons is the
+    [(group name, [(material name, vertex indices)])] list of collect_actors(), a sorted copy is returned.
+    """
+    result = []
+    for group_name, group_polys in polygons:
+        buckets = {}
+        order = []
+        for polygon in group_polys:
+            material = polygon[0]
+            if material not in buckets:
+                buckets[material] = []
+                order.append(material)
+            buckets[material].append(polygon)
+        result.append((group_name, [polygon for material in order for polygon in buckets[material]]))
+    return result
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import json
+import zlib
+import hashlib
+from array import array
+
+from eggbin import little_endian
+from morphs import morph_deltas
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def geometry_fingerprint(num_vertices, sets):
+    # vertex count and polygon vertex lists; dial values do not change them, a reloaded or edited mesh does
+    return '%d-%08x' % (num_vertices, zlib.crc32(sets.tostring()) & 0xffffffff)
+
+
+class MorphCache:
+    """
+    On-disk cache of morph delta tables, so exports of the same figure with other dial values skip the
+    MorphTargetDelta call per vertex. Entries are keyed by figure, actor InternalName, morph name and
+    geometry_fingerprint() and stored as raw little-endian float64 x, y, z triples, which are memory-mapped with
+    NumPy or read in one call without it. An index file keeps the size and last use of every entry; the least
+    recently used entries are removed when the total grows over max_bytes.
+    """
+    INDEX = 'index.json'
+    MAX_BYTES = 512 << 20
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # file name -> {'key': [...], 'size': bytes, 'used': time of last use}
+        self.entries = {}
+        try:
+            f = open(os.path.join(directory, self.INDEX))
+            try:
+                self.entries = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            pass
+
+    def filename(self, key):
+        return hashlib.sha1(repr(key)).hexdigest() + '.deltas'
+
+    def get(self, key, num_vertices):
+        # cached deltas as morph_deltas() returns them, None when missing or stale
+        name = self.filename(key)
+        path = os.path.join(self.directory, name)
+        size = num_vertices * 3 * 8
+        if name not in self.entries or not size or not os.path.exists(path) or os.path.getsize(path) != size:
+            return None
+        self.entries[name]['used'] = time.time()
+        if numpy is not None:
+            return numpy.memmap(path, dtype='<f8', mode='r', shape=(num_vertices, 3))
+        deltas = array('d')
+        f = open(path, 'rb')
+        try:
+            deltas.fromfile(f, num_vertices * 3)
+        finally:
+            f.close()
+        return little_endian(deltas)
+
+    def put(self, key, deltas):
+        name = self.filename(key)
+        path = os.path.join(self.directory, name)
+        # written under a temporary name, other Poser sessions never map half a file
+        f = open(path + '.tmp', 'wb')
+        try:
+            if numpy is not None:
+                f.write(numpy.asarray(deltas, dtype='<f8').tostring())
+            else:
+                f.write(little_endian(array('d', deltas)).tostring())
+        finally:
+            f.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+        self.entries[name] = {'key': list(key), 'size': os.path.getsize(path), 'used': time.time()}
+
+    def deltas(self, figure_name, actor, morph, num_vertices, fingerprint):
+        # morph_deltas() of one morph target, from the cache when possible
+        key = (figure_name, actor.InternalName(), morph.Name(), fingerprint)
+        deltas = self.get(key, num_vertices)
+        if deltas is not None:
+            self.hits += 1
+            return deltas
+        self.misses += 1
+        deltas = morph_deltas(morph, num_vertices)
+        if num_vertices:
+            self.put(key, deltas)
+        return deltas
+
+    def size(self):
+        return sum([entry['size'] for entry in self.entries.values()])
+
+    def evict(self):
+        # drop least recently used entries until the cache fits in max_bytes
+        total = self.size()
+        for name in sorted(self.entries, key=lambda name: self.entries[name]['used']):
+            if total <= self.max_bytes:
+                break
+            try:
+                path = os.path.join(self.directory, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                # still mapped, windows does not delete open files; next time
+                continue
+            total -= self.entries.pop(name)['size']
+
+    def save(self):
+        self.evict()
+        f = open(os.path.join(self.directory, self.INDEX), 'w')
+        try:
+            json.dump(self.entries, f)
+        finally:
+            f.close()
+
+    def report(self):
+        return 'morph cache: %d hits, %d misses, %d entries, %d bytes' % (self.hits, self.misses, len(self.entries),
+                                                                        self.size())
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def morph_targets(actor):
+    # morph targets of the actor, whatever their value
+    return [p for p in actor.Parameters() if p.IsMorphTarget() and not p.Name().startswith('EMPTY') and p.Name() != '-' and not p.Name().startswith('V4')]
+
+
+def active_morphs(actor):
+    # morph targets dialed in on the actor
+    #morphs = [p for p in all_params if not p.Name().startswith('EMPTY') and not p.Name().startswith('V4') and p.Name() != '-' and p.IsMorphTarget() and (abs(p.Value()-0.0) > 0.001) and p.Hidden() != 1]
+    #morphs = [p for p in all_params if p.IsMorphTarget() and p.IsValueParameter() and (abs(p.Value() - 0.0) > 0.1)]
+    return [p for p in morph_targets(actor) if abs(p.Value() - 0.0) > 0.1]
+
+
+def morph_deltas(morph, num_vertices):
+    """
+    Pull the whole delta table of a morph target from Poser, one MorphTargetDelta call per vertex.
+    Returns a (num_vertices, 3) NumPy array, or a flat array('d') of x, y, z triples without NumPy.
+    """
+    if numpy is not None:
+        return numpy.array([morph.MorphTargetDelta(v) for v in xrange(num_vertices)], dtype=numpy.float64)
+    deltas = array('d')
+    for v in xrange(num_vertices):
+        deltas.extend(morph.MorphTargetDelta(v))
+    return deltas
+
+
+def sparse_deltas(deltas, threshold):
+    """
+    Keep only the vertices a morph moves further than threshold along any axis, deltas comes from morph_deltas().
+    Returns {poser vertex index: (dx, dy, dz)}.
+    """
+    if numpy is not None:
+        moved = numpy.flatnonzero(numpy.abs(deltas).max(axis=1) > threshold)
+        return dict(zip(moved.tolist(), [tuple(d) for d in deltas[moved].tolist()]))
+    sparse = {}
+    for v in xrange(len(deltas) // 3):
+        d = tuple(deltas[3 * v: 3 * v + 3])
+        if abs(d[0]) > threshold or abs(d[1]) > threshold or abs(d[2]) > threshold:
+            sparse[v] = d
+    return sparse
+
+
+def vertex_positions(vertices):
+    # Poser vertex list -> (n, 3) NumPy array, or flat array('d') of x, y, z triples without NumPy
+    if numpy is not None:
+        return numpy.array([(v.X(), v.Y(), v.Z()) for v in vertices], dtype=numpy.float64)
+    positions = array('d')
+    for v in vertices:
+        positions.extend((v.X(), v.Y(), v.Z()))
+    return positions
+
+
+def bake_morphs(positions, morphs):
+    """
+    Apply all morphs to the actor vertex positions as one weighted sum, so every vertex is morphed once no matter
+    how many polygons share it. positions comes from vertex_positions(), morphs is a list of (value, deltas) with
+    deltas from morph_deltas(). Returns the morphed positions as a list of (x, y, z) tuples.
+    """
+    if numpy is not None:
+        for value, deltas in morphs:
+            positions = positions + value * deltas
+        return [tuple(p) for p in positions.tolist()]
+    positions = array('d', positions)
+    for value, deltas in morphs:
+        for i in xrange(len(positions)):
+            positions[i] += deltas[i] * value
+    return zip(positions[0::3], positions[1::3], positions[2::3])
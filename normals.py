@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def face_normals(positions, polygons, sets):
+    # Newell normal of every polygon; its length is twice the polygon area, so summing them weights by area
+    faces = []
+    for start, num_vertices, material in polygons:
+        nx = ny = nz = 0.0
+        corners = sets[start: start + num_vertices]
+        for k in xrange(num_vertices):
+            x0, y0, z0 = positions[corners[k]]
+            x1, y1, z1 = positions[corners[(k + 1) % num_vertices]]
+            nx += (y0 - y1) * (z0 + z1)
+            ny += (z0 - z1) * (x0 + x1)
+            nz += (x0 - x1) * (y0 + y1)
+        faces.append((nx, ny, nz))
+    return faces
+
+
+def _unit(v):
+    length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    if length == 0.0:
+        return None
+    return v[0] / length, v[1] / length, v[2] / length
+
+
+def _smooth_normals_python(positions, polygons, sets, min_cos):
+    faces = face_normals(positions, polygons, sets)
+    units = [_unit(f) or (0.0, 0.0, 0.0) for f in faces]
+    # polygons around every poser vertex
+    incident = {}
+    for p, (start, num_vertices, material) in enumerate(polygons):
+        for v in sets[start: start + num_vertices]:
+            incident.setdefault(v, []).append(p)
+    normals = []
+    for p, (start, num_vertices, material) in enumerate(polygons):
+        ux, uy, uz = units[p]
+        for v in sets[start: start + num_vertices]:
+            nx = ny = nz = 0.0
+            for q in incident[v]:
+                qx, qy, qz = units[q]
+                if ux * qx + uy * qy + uz * qz >= min_cos:
+                    fx, fy, fz = faces[q]
+                    nx += fx
+                    ny += fy
+                    nz += fz
+            normals.append(_unit((nx, ny, nz)))
+    return normals
+
+
+def _smooth_normals_numpy(positions, polygons, sets, min_cos):
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    starts = numpy.array([p[0] for p in polygons], dtype=numpy.intp)
+    counts = numpy.array([p[1] for p in polygons], dtype=numpy.intp)
+    num_corners = int(counts.sum())
+    # flat corner arrays in polygon order: poser vertex, polygon, index of the next corner of the same polygon
+    corner_face = numpy.repeat(numpy.arange(len(polygons)), counts)
+    first_corner = numpy.cumsum(counts) - counts
+    within = numpy.arange(num_corners) - first_corner[corner_face]
+    sets = numpy.asarray(sets, dtype=numpy.intp)
+    corner_vertex = sets[starts[corner_face] + within]
+    next_corner = first_corner[corner_face] + (within + 1) % counts[corner_face]
+    p0 = positions[corner_vertex]
+    p1 = positions[corner_vertex[next_corner]]
+    terms = numpy.empty((num_corners, 3))
+    terms[:, 0] = (p0[:, 1] - p1[:, 1]) * (p0[:, 2] + p1[:, 2])
+    terms[:, 1] = (p0[:, 2] - p1[:, 2]) * (p0[:, 0] + p1[:, 0])
+    terms[:, 2] = (p0[:, 0] - p1[:, 0]) * (p0[:, 1] + p1[:, 1])
+    faces = numpy.empty((len(polygons), 3))
+    for axis in xrange(3):
+        faces[:, axis] = numpy.bincount(corner_face, terms[:, axis], minlength=len(polygons))
+    lengths = numpy.sqrt((faces * faces).sum(axis=1))
+    units = faces / numpy.where(lengths > 0.0, lengths, 1.0)[:, None]
+    # pair every corner with all corners on the same poser vertex, itself included
+    order = numpy.argsort(corner_vertex, kind='mergesort')
+    sorted_vertex = corner_vertex[order]
+    group_start = numpy.searchsorted(sorted_vertex, corner_vertex, side='left')
+    group_size = numpy.searchsorted(sorted_vertex, corner_vertex, side='right') - group_start
+    pair_corner = numpy.repeat(numpy.arange(num_corners), group_size)
+    pair_offset = numpy.arange(len(pair_corner)) - numpy.repeat(numpy.cumsum(group_size) - group_size, group_size)
+    pair_face = corner_face[order[numpy.repeat(group_start, group_size) + pair_offset]]
+    own_face = corner_face[pair_corner]
+    keep = (units[own_face] * units[pair_face]).sum(axis=1) >= min_cos
+    pair_corner = pair_corner[keep]
+    pair_face = pair_face[keep]
+    normals = numpy.empty((num_corners, 3))
+    for axis in xrange(3):
+        normals[:, axis] = numpy.bincount(pair_corner, faces[pair_face, axis], minlength=num_corners)
+    lengths = numpy.sqrt((normals * normals).sum(axis=1))
+    normals /= numpy.where(lengths > 0.0, lengths, 1.0)[:, None]
+    return [length > 0.0 and tuple(n) or None for n, length in zip(normals.tolist(), lengths.tolist())]
+
+
+def smooth_normals(positions, polygons, sets, angle=120.0):
+    """
+    Recompute smooth vertex normals the way `egg-trans -nv <angle>` does, but area weighted and before the egg is
+    written. Every polygon corner gets the sum of the normals of the polygons around its poser vertex that are
+    within angle degrees of its own polygon, so creases sharper than that stay split. positions are the (baked)
+    actor vertex positions and polygons/sets as in ActorSnapshot. Returns one unit normal per corner in polygon
+    order, None where all surrounding polygons are degenerate.
+    """
+    if not polygons:
+        return []
+    min_cos = math.cos(math.radians(angle))
+    if numpy is not None:
+        return _smooth_normals_numpy(positions, polygons, sets, min_cos)
+    return _smooth_normals_python(positions, polygons, sets, min_cos)
+
+
+def _perpendicular(n):
+    # any unit vector perpendicular to n, used where the uvs give no tangent direction
+    a = abs(n[0]) < 0.9 and (1.0, 0.0, 0.0) or (0.0, 1.0, 0.0)
+    d = a[0] * n[0] + a[1] * n[1] + a[2] * n[2]
+    return _unit((a[0] - n[0] * d, a[1] - n[1] * d, a[2] - n[2] * d)) or (1.0, 0.0, 0.0)
+
+
+def _fan_triangles(polygons):
+    # (first, k, k + 1) egg vertex index triples of every polygon
+    for (group_name, group_polys) in polygons:
+        for (material, refs) in group_polys:
+            r0 = refs[0]
+            for k in xrange(1, len(refs) - 1):
+                yield r0, refs[k], refs[k + 1]
+
+
+def _tangent_frames_python(vertices, polygons):
+    tangents = [[0.0, 0.0, 0.0] for v in vertices]
+    binormals = [[0.0, 0.0, 0.0] for v in vertices]
+    for i0, i1, i2 in _fan_triangles(polygons):
+        (p0, n0, t0), (p1, n1, t1), (p2, n2, t2) = vertices[i0], vertices[i1], vertices[i2]
+        e1 = (p1[0] - p0[0], p1[1] - p0[1], p1[2] - p0[2])
+        e2 = (p2[0] - p0[0], p2[1] - p0[1], p2[2] - p0[2])
+        du1, dv1, du2, dv2 = t1[0] - t0[0], t1[1] - t0[1], t2[0] - t0[0], t2[1] - t0[1]
+        r = du1 * dv2 - du2 * dv1
+        if r == 0.0:
+            continue
+        r = 1.0 / r
+        t = ((e1[0] * dv2 - e2[0] * dv1) * r, (e1[1] * dv2 - e2[1] * dv1) * r, (e1[2] * dv2 - e2[2] * dv1) * r)
+        b = ((e2[0] * du1 - e1[0] * du2) * r, (e2[1] * du1 - e1[1] * du2) * r, (e2[2] * du1 - e1[2] * du2) * r)
+        for i in (i0, i1, i2):
+            ti, bi = tangents[i], binormals[i]
+            ti[0] += t[0]
+            ti[1] += t[1]
+            ti[2] += t[2]
+            bi[0] += b[0]
+            bi[1] += b[1]
+            bi[2] += b[2]
+    frames = []
+    for (p, n, uv), t, b in zip(vertices, tangents, binormals):
+        # Gram-Schmidt against the normal, the binormal keeps the handedness of the uv mapping
+        d = n[0] * t[0] + n[1] * t[1] + n[2] * t[2]
+        t = _unit((t[0] - n[0] * d, t[1] - n[1] * d, t[2] - n[2] * d)) or _perpendicular(n)
+        c = (n[1] * t[2] - n[2] * t[1], n[2] * t[0] - n[0] * t[2], n[0] * t[1] - n[1] * t[0])
+        if c[0] * b[0] + c[1] * b[1] + c[2] * b[2] < 0.0:
+            c = (-c[0], -c[1], -c[2])
+        frames.append((t, c))
+    return frames
+
+
+def _tangent_frames_numpy(vertices, polygons):
+    triangles = numpy.fromiter((i for triangle in _fan_triangles(polygons) for i in triangle), dtype=numpy.intp)
+    triangles = triangles.reshape(-1, 3)
+    positions = numpy.array([v[0] for v in vertices], dtype=numpy.float64).reshape(-1, 3)
+    normals = numpy.array([v[1] for v in vertices], dtype=numpy.float64).reshape(-1, 3)
+    uvs = numpy.array([v[2] for v in vertices], dtype=numpy.float64).reshape(-1, 2)
+    e1 = positions[triangles[:, 1]] - positions[triangles[:, 0]]
+    e2 = positions[triangles[:, 2]] - positions[triangles[:, 0]]
+    d1 = uvs[triangles[:, 1]] - uvs[triangles[:, 0]]
+    d2 = uvs[triangles[:, 2]] - uvs[triangles[:, 0]]
+    r = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+    valid = r != 0.0
+    r = numpy.where(valid, 1.0 / numpy.where(valid, r, 1.0), 0.0)[:, None]
+    t = (e1 * d2[:, 1:2] - e2 * d1[:, 1:2]) * r
+    b = (e2 * d1[:, 0:1] - e1 * d2[:, 0:1]) * r
+    # accumulate on every corner of the triangles, so shared egg vertices average their polygons
+    corners = triangles.ravel()
+    tangents = numpy.empty((len(vertices), 3))
+    binormals = numpy.empty((len(vertices), 3))
+    for axis in xrange(3):
+        tangents[:, axis] = numpy.bincount(corners, numpy.repeat(t[:, axis], 3), minlength=len(vertices))
+        binormals[:, axis] = numpy.bincount(corners, numpy.repeat(b[:, axis], 3), minlength=len(vertices))
+    tangents -= normals * (normals * tangents).sum(axis=1)[:, None]
+    lengths = numpy.sqrt((tangents * tangents).sum(axis=1))
+    tangents /= numpy.where(lengths > 0.0, lengths, 1.0)[:, None]
+    # same fallback as _perpendicular() where the uvs give no direction
+    missing = lengths == 0.0
+    if missing.any():
+        n = normals[missing]
+        a = numpy.zeros_like(n)
+        x_axis = numpy.abs(n[:, 0]) < 0.9
+        a[x_axis, 0] = 1.0
+        a[~x_axis, 1] = 1.0
+        a -= n * (n * a).sum(axis=1)[:, None]
+        tangents[missing] = a / numpy.sqrt((a * a).sum(axis=1))[:, None]
+    # the binormal keeps the handedness of the uv mapping
+    crosses = numpy.cross(normals, tangents)
+    crosses *= numpy.where((crosses * binormals).sum(axis=1) < 0.0, -1.0, 1.0)[:, None]
+    return zip([tuple(t) for t in tangents.tolist()], [tuple(c) for c in crosses.tolist()])
+
+
+def tangent_frames(vertices, polygons):
+    """
+    Tangent and binormal of every egg vertex for normal mapping, what `egg-trans -tbnall` adds. Tangents of the
+    (fan triangulated) polygons follow the uv mapping and are summed on the welded egg vertices, then made
+    orthogonal to the vertex normal. vertices and polygons are as returned by collect_actors(). Returns a list of
+    (tangent, binormal) tuples parallel to vertices.
+    """
+    if numpy is not None and vertices:
+        return _tangent_frames_numpy(vertices, polygons)
+    return _tangent_frames_python(vertices, polygons)
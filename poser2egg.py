@@ -21,12 +21,26 @@ import os
 
 from utils import *
 from egg import EggObject
+from writer import EggWriter, BinaryEggWriter
+from incremental import PreviousExport, supports
 
 
 class Poser2Egg():
     SKIP_OVERWRITE = True
     RECOMPUTE_NORMALS = False
+    # crease angle of the recomputed normals, like egg-trans -nv
+    NORMAL_ANGLE = 120.0
     COMPUTE_TBN = False
+    # 'egg' writes text eggs, 'binary' the .p2eb format of eggbin.py that loads without text parsing
+    FORMAT = 'egg'
+    EXTENSIONS = {'egg': '.egg', 'binary': '.p2eb'}
+    # compress the output on the fly into .pz files, which Panda3D loads directly; level 1 is fastest, 9 smallest
+    COMPRESS = False
+    COMPRESS_LEVEL = 6
+    # directory for cached morph deltas, reused by later exports of the same figure; None to skip
+    MORPH_CACHE = None
+    # rewrite only the actors that changed since the last export to the same text egg
+    INCREMENTAL = False
 
     def export(self):
         # get selected figure
@@ -36,9 +50,14 @@ class Poser2Egg():
         assert figure, 'No currently selected figure!'
         figureName = fix_name(figure.Name())
         abort = False
-        getSaveFile = poser.DialogFileChooser(2, 0, "Save Egg File", figureName, '', '*.egg')
+        extension = Poser2Egg.EXTENSIONS[Poser2Egg.FORMAT]
+        if Poser2Egg.COMPRESS:
+            extension += '.pz'
+        getSaveFile = poser.DialogFileChooser(2, 0, "Save Egg File", figureName, '', '*' + extension)
         getSaveFile.Show()
         fileName = getSaveFile.Path()
+        if Poser2Egg.COMPRESS and not fileName.endswith('.pz'):
+            fileName += '.pz'
         if os.path.exists(fileName) and not Poser2Egg.SKIP_OVERWRITE:
             if not poser.DialogSimple.YesNo("Overwrite " + fileName + "?"):
                 abort = True
@@ -48,16 +67,12 @@ class Poser2Egg():
             print 'Exporting character:', figureName, 'to', fileName
             try:
                 egg_obj = EggObject(figure)
-                lines = egg_obj.export()
-                output = open(fileName, 'w')
-                output.write("".join(lines))
-                output.close()
-                # write anim
-                lines = egg_obj.write_animation()
-                #print lines
-                output = open(os.path.join(os.path.dirname(fileName), "a.egg"), 'w')
-                output.write("".join(lines))
-                output.close()
+                if Poser2Egg.RECOMPUTE_NORMALS:
+                    egg_obj.options["normal_angle"] = Poser2Egg.NORMAL_ANGLE
+                egg_obj.options["tbn"] = Poser2Egg.COMPUTE_TBN
+                egg_obj.options["morph_cache"] = Poser2Egg.MORPH_CACHE
+                egg_obj.options["incremental"] = Poser2Egg.INCREMENTAL
+                self.write_egg(egg_obj, fileName, os.path.join(os.path.dirname(fileName), "a" + extension))
             except IOError, (errno, strerror):
                 print 'failed to open file', fileName, 'for writing'
                 print "I/O error(%s): %s" % (errno, strerror)
@@ -65,16 +80,46 @@ class Poser2Egg():
                 print 'finished writing data'
             if body_part:
                 self.restore_ik_chains(figure, ikStatusList)
-            if Poser2Egg.RECOMPUTE_NORMALS:
-                self.recompute_egg_normals(fileName)
 
-    def recompute_egg_normals(self, fileName):
-        print "Recompute vertex normals"
-        os.chdir(os.path.dirname(fileName))
-        cmdln = 'egg-trans "' + fileName + '" -nv 120 -o ' + fileName
-        print cmdln
-        if os.system(cmdln) == 1:
-            print "Error while processing egg file!"
+    def writer_class(self, fileName):
+        # the file extension picks the backend, so batch and replay exports can write binary files too
+        name = fileName.lower()
+        if name.endswith('.pz'):
+            name = name[:-3]
+        if name.endswith(Poser2Egg.EXTENSIONS['binary']):
+            return BinaryEggWriter
+        return EggWriter
+
+    def write_egg(self, egg_obj, fileName, animFileName=None):
+        incremental = egg_obj.options["incremental"]
+        if incremental and not supports(fileName):
+            print 'Incremental export needs an uncompressed text egg, writing', fileName, 'in full'
+            incremental = egg_obj.options["incremental"] = False
+        if incremental:
+            egg_obj.previous = PreviousExport.open(fileName)
+        try:
+            self.write_file(egg_obj, fileName, egg_obj.export)
+        except:
+            # drop the moved aside egg of a failed incremental export, the next export starts over
+            if egg_obj.previous is not None:
+                egg_obj.previous.close()
+                egg_obj.previous = None
+            raise
+        if incremental:
+            egg_obj.finish_incremental(fileName)
+        if animFileName:
+            # write anim
+            self.write_file(egg_obj, animFileName, egg_obj.write_animation)
+        egg_obj.finish()
+
+    def write_file(self, egg_obj, fileName, write):
+        writer = self.writer_class(fileName).open(fileName, Poser2Egg.COMPRESS_LEVEL)
+        try:
+            write(writer)
+        finally:
+            # closed on errors too, batch exports go on with the next job in the same session
+            with egg_obj.instrument.stage('file_write'):
+                writer.close()
 
     def remove_ik_chains(self, figure):
         ikStatusList = []
@@ -88,5 +133,6 @@ class Poser2Egg():
             figure.SetIkStatus(i, ikStatusList[i])
 
 
-exporter = Poser2Egg()
-exporter.export()
+if __name__ == '__main__':
+    exporter = Poser2Egg()
+    exporter.export()
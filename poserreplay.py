@@ -0,0 +1,336 @@
+############################################################
+#
+# poserreplay.py - stand-in for the `poser` module
+#
+# Replays a snapshot written by snapshot.py with the part of the
+# PoserPython API the exporter uses, so EggObject exports can be run,
+# timed and diffed on any machine:
+#
+#   import poserreplay
+#   poserreplay.install('figure.p2es')   # before importing egg
+#
+# or from the command line:
+#
+#   python poserreplay.py figure.p2es out.egg [anim.egg]
+#
+############################################################
+import sys
+
+import snapshot as snapshots
+
+
+class ReplayVertex:
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+    def X(self):
+        return self.x
+
+    def Y(self):
+        return self.y
+
+    def Z(self):
+        return self.z
+
+
+class ReplayTexVertex:
+    def __init__(self, u, v):
+        self.u, self.v = u, v
+
+    def U(self):
+        return self.u
+
+    def V(self):
+        return self.v
+
+
+class ReplayPolygon:
+    def __init__(self, start, num_vertices, material_name=None):
+        self.start = start
+        self.num_vertices = num_vertices
+        self.material_name = material_name
+
+    def Start(self):
+        return self.start
+
+    def NumVertices(self):
+        return self.num_vertices
+
+    NumTexVertices = NumVertices
+
+    def MaterialName(self):
+        return self.material_name
+
+
+class ReplayGeometry:
+    def __init__(self, data):
+        self.data = data
+        self._cache = {}
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def _triples(self, key):
+        values = snapshots.unpack(self.data[key])
+        return [ReplayVertex(values[i], values[i + 1], values[i + 2]) for i in xrange(0, len(values), 3)]
+
+    def Vertices(self):
+        return self._cached('vertices', lambda: self._triples('vertices'))
+
+    def Normals(self):
+        return self._cached('normals', lambda: self._triples('normals'))
+
+    def TexVertices(self):
+        def build():
+            values = snapshots.unpack(self.data['tex_vertices'])
+            return [ReplayTexVertex(values[i], values[i + 1]) for i in xrange(0, len(values), 2)]
+        return self._cached('tex_vertices', build)
+
+    def Polygons(self):
+        def build():
+            values = snapshots.unpack(self.data['polygons'])
+            names = self.data['material_names']
+            materials = snapshots.unpack(self.data['polygon_materials'])
+            return [ReplayPolygon(values[2 * i], values[2 * i + 1], names[m]) for i, m in enumerate(materials)]
+        return self._cached('polygons', build)
+
+    def TexPolygons(self):
+        def build():
+            values = snapshots.unpack(self.data['tex_polygons'])
+            return [ReplayPolygon(values[i], values[i + 1]) for i in xrange(0, len(values), 2)]
+        return self._cached('tex_polygons', build)
+
+    def Sets(self):
+        return self._cached('sets', lambda: snapshots.unpack(self.data['sets']).tolist())
+
+    def TexSets(self):
+        return self._cached('tex_sets', lambda: snapshots.unpack(self.data['tex_sets']).tolist())
+
+    def NumVertices(self):
+        return len(self.data['vertices'][2]) // 24
+
+    def NumPolygons(self):
+        return len(self.Polygons())
+
+
+class ReplayParameter:
+    def __init__(self, actor, data):
+        self.actor = actor
+        self.data = data
+        self.value = data['value']
+        self._deltas = None
+
+    def Name(self):
+        return self.data['name']
+
+    def InternalName(self):
+        return self.data['name']
+
+    def IsMorphTarget(self):
+        return 1
+
+    def IsValueParameter(self):
+        return 1
+
+    def Hidden(self):
+        return self.data['hidden']
+
+    def Value(self):
+        return self.value
+
+    def SetValue(self, value):
+        self.value = value
+
+    def MorphTargetDelta(self, vertex_index):
+        if self._deltas is None:
+            indices = snapshots.unpack(self.data['indices'])
+            deltas = snapshots.unpack(self.data['deltas'])
+            self._deltas = dict([(v, (deltas[3 * i], deltas[3 * i + 1], deltas[3 * i + 2]))
+                                 for i, v in enumerate(indices)])
+        return self._deltas.get(vertex_index, (0.0, 0.0, 0.0))
+
+
+class ReplayActor:
+    def __init__(self, scene, data):
+        self.scene = scene
+        self.data = data
+        self.geometry = data['geometry'] and ReplayGeometry(data['geometry'])
+        self.parameters = [ReplayParameter(self, morph) for morph in data['morphs']]
+        self.origins = data.get('origins') and snapshots.unpack(data['origins'])
+        self.quaternions = data.get('quaternions') and snapshots.unpack(data['quaternions'])
+
+    def Name(self):
+        return self.data['name']
+
+    def InternalName(self):
+        return self.data['internal_name']
+
+    def IsBodyPart(self):
+        return self.data['body_part']
+
+    def Geometry(self):
+        return self.geometry
+
+    def Parameters(self):
+        return self.parameters
+
+    def Parent(self):
+        return self.scene.actor(self.data['parent'])
+
+    def Children(self):
+        return [self.scene.actor(i) for i in self.data['children']]
+
+    def WorldMatrix(self):
+        return self.data['world_matrix']
+
+    def LocalMatrix(self):
+        return self.data['local_matrix']
+
+    def Origin(self):
+        if not self.origins:
+            return (0.0, 0.0, 0.0)
+        i = 3 * self.scene.frame_slot
+        return self.origins[i], self.origins[i + 1], self.origins[i + 2]
+
+    def LocalQuaternion(self):
+        if not self.quaternions:
+            return (1.0, 0.0, 0.0, 0.0)
+        i = 4 * self.scene.frame_slot
+        return self.quaternions[i], self.quaternions[i + 1], self.quaternions[i + 2], self.quaternions[i + 3]
+
+    def LocalDisplacement(self):
+        return (0.0, 0.0, 0.0)
+
+
+class ReplayMaterial:
+    def __init__(self, data):
+        self.data = data
+
+    def Name(self):
+        return self.data['name']
+
+    def TextureMapFileName(self):
+        return self.data['texture']
+
+    def BumpMapFileName(self):
+        return self.data['bump']
+
+    def TransparencyMapFileName(self):
+        return self.data['transparency']
+
+    def DiffuseColor(self):
+        return self.data['diffuse']
+
+    def SpecularColor(self):
+        return self.data['specular']
+
+
+class ReplayFigure:
+    def __init__(self, scene, data):
+        self.scene = scene
+        self.data = data
+        self.materials = [ReplayMaterial(m) for m in data['materials']]
+
+    def Name(self):
+        return self.data['name']
+
+    def ParentActor(self):
+        return self.scene.actor(self.data['root'])
+
+    def UnimeshInfo(self):
+        actors = [self.scene.actor(i) for i in self.data['unimesh']]
+        return None, actors, [None] * len(actors)
+
+    def Materials(self):
+        return self.materials
+
+    def NumIkChains(self):
+        return 0
+
+
+class ReplayScene:
+    def __init__(self, data):
+        self.data = data
+        self.actors = [ReplayActor(self, actor) for actor in data['actors']]
+        # stands in for the UNIVERSE actor Poser returns as parent of the figure root
+        self.universe = ReplayActor(self, {'name': 'UNIVERSE', 'internal_name': 'UNIVERSE', 'body_part': 0,
+                                           'parent': -1, 'children': [], 'geometry': None, 'morphs': [],
+                                           'world_matrix': None, 'local_matrix': None})
+        self.figure = ReplayFigure(self, data['figure'])
+        self.slots = dict([(frame, slot) for slot, frame in enumerate(data['frames'])])
+        self.frame = data['frames'][0] if data['frames'] else 0
+        self.frame_slot = 0
+        self.draw_calls = 0
+
+    def actor(self, index):
+        if index < 0:
+            return self.universe
+        return self.actors[index]
+
+    def CurrentFigure(self):
+        return self.figure
+
+    def Figure(self, name):
+        if name == self.figure.Name():
+            return self.figure
+        return None
+
+    def NumFrames(self):
+        return self.data['num_frames']
+
+    def Frame(self):
+        return self.frame
+
+    def SetFrame(self, frame):
+        # frames that were not captured keep the last captured transforms
+        self.frame = frame
+        self.frame_slot = self.slots.get(frame, self.frame_slot)
+
+    def DrawAll(self):
+        self.draw_calls += 1
+
+    def ProcessSomeEvents(self):
+        pass
+
+
+_scene = None
+_content_root = ''
+
+
+def Scene():
+    return _scene
+
+
+def ContentRootLocation():
+    return _content_root
+
+
+def OpenDocument(filename):
+    load(filename)
+
+
+def load(filename_or_snapshot):
+    global _scene, _content_root
+    data = filename_or_snapshot
+    if isinstance(data, basestring):
+        data = snapshots.load(data)
+    _scene = ReplayScene(data)
+    _content_root = data['content_root']
+    return _scene
+
+
+def install(filename_or_snapshot):
+    # make `import poser` resolve to this module
+    scene = load(filename_or_snapshot)
+    sys.modules['poser'] = sys.modules[__name__]
+    return scene
+
+
+if __name__ == '__main__':
+    install(sys.argv[1])
+    from egg import EggObject
+    from poser2egg import Poser2Egg
+    anim_file = len(sys.argv) > 3 and sys.argv[3] or None
+    Poser2Egg().write_egg(EggObject(Scene().CurrentFigure()), sys.argv[2], anim_file)
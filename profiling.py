@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import json
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_memory_kb():
+    # high-water mark of the process memory in KB, None where it can not be read
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            # bytes on mac os
+            peak //= 1024
+        return peak
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                     ctypes.byref(counters), counters.cb)
+            return counters.PeakWorkingSetSize // 1024
+        except (ImportError, AttributeError, OSError):
+            return None
+    return None
+
+
+# Timing record of one export stage
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        # vertices, polygons, joints, ... whatever the stage produces
+        self.items = None
+        # bytes the stage wrote to the egg, None for stages that do not write
+        self.bytes = None
+        self.peak_memory_kb = None
+
+    def as_dict(self):
+        return {'stage': self.name, 'seconds': self.seconds, 'items': self.items, 'bytes': self.bytes,
+                'peak_memory_kb': self.peak_memory_kb}
+
+    def __str__(self):
+        return '%-18s %8.3f s %10s items %12s bytes %10s KB peak' % (
+            self.name, self.seconds, self.items is not None and self.items or '-',
+            self.bytes is not None and self.bytes or '-',
+            self.peak_memory_kb is not None and self.peak_memory_kb or '-')
+
+
+# Records duration, item count, bytes written and memory high-water mark of every export stage, optionally under
+# cProfile, and sums them up as a machine readable summary.
+class Instrumentation:
+    def __init__(self):
+        self.stages = []
+        self.profiler = None
+
+    @contextmanager
+    def stage(self, name, writer=None):
+        stage = Stage(name)
+        start_bytes = writer is not None and writer.tell()
+        start = time.time()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.time() - start
+            if writer is not None:
+                stage.bytes = writer.tell() - start_bytes
+            stage.peak_memory_kb = peak_memory_kb()
+            self.stages.append(stage)
+            print stage
+
+    def start_profile(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, filename):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.profiler.dump_stats(filename)
+        self.profiler = None
+
+    def summary(self):
+        return {'stages': [stage.as_dict() for stage in self.stages],
+                'seconds': sum([stage.seconds for stage in self.stages]),
+                'bytes': sum([stage.bytes or 0 for stage in self.stages]),
+                'peak_memory_kb': peak_memory_kb()}
+
+    def write_summary(self, filename):
+        output = open(filename, 'w')
+        json.dump(self.summary(), output, indent=2)
+        output.close()
@@ -0,0 +1,175 @@
+############################################################
+#
+# snapshot.py - capture a Poser figure for offline replay
+#
+# Run inside Poser via File/Run script to capture the current figure
+# into a binary snapshot file: UnimeshInfo geometry, materials, actor
+# hierarchy, morph targets and joint transforms of every frame.
+# poserreplay.py loads the snapshot as a stand-in for the `poser`
+# module, so exports can be run and timed outside Poser.
+#
+# File layout: the 8 byte magic 'P2ESNAP1' followed by a zlib
+# compressed pickle (protocol 2) of a plain dict. Numeric tables are
+# stored as (typecode, byteorder, bytes) triples of array.array data,
+# 'd' for floats and 'i' for indices:
+#
+#   version, content_root, num_frames, frames
+#   figure: name, root, unimesh (actor indices), materials
+#   actors: name, internal_name, body_part, parent, children,
+#           world_matrix, local_matrix, origins (3 per frame),
+#           quaternions (4 per frame, w x y z), geometry, morphs
+#   geometry: vertices, normals (3 per vertex), tex_vertices (2 per
+#           vertex), polygons, tex_polygons (start, count pairs),
+#           polygon_materials (index into material_names), sets, tex_sets
+#   morphs: name, value, hidden, indices, deltas (3 per index)
+#
+############################################################
+import sys
+import zlib
+import cPickle
+from array import array
+
+MAGIC = 'P2ESNAP1'
+VERSION = 1
+
+
+def pack(typecode, values):
+    return (typecode, sys.byteorder, array(typecode, values).tostring())
+
+
+def unpack(packed):
+    typecode, byteorder, data = packed
+    values = array(typecode)
+    values.fromstring(data)
+    if byteorder != sys.byteorder:
+        values.byteswap()
+    return values
+
+
+def save(snapshot, filename):
+    output = open(filename, 'wb')
+    output.write(MAGIC)
+    output.write(zlib.compress(cPickle.dumps(snapshot, 2), 6))
+    output.close()
+
+
+def load(filename):
+    data = open(filename, 'rb').read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a poser2egg snapshot' % filename)
+    snapshot = cPickle.loads(zlib.decompress(data[len(MAGIC):]))
+    if snapshot['version'] != VERSION:
+        raise ValueError('unsupported snapshot version %s' % snapshot['version'])
+    return snapshot
+
+
+class SnapshotCapture:
+    def __init__(self, scene, figure, content_root=''):
+        self.scene = scene
+        self.figure = figure
+        self.content_root = content_root
+        self.actors = []
+        self.indices = {}
+
+    def actor_index(self, actor):
+        name = actor.InternalName()
+        if name not in self.indices:
+            self.indices[name] = len(self.actors)
+            self.actors.append(actor)
+        return self.indices[name]
+
+    def capture(self, frames=None):
+        if frames is None:
+            frames = range(0, self.scene.NumFrames())
+        root = self.actor_index(self.figure.ParentActor())
+        self.walk(self.figure.ParentActor())
+        uniGeometry, uniActorList, uniActorVertexInfoList = self.figure.UnimeshInfo()
+        unimesh = [self.actor_index(actor) for actor in uniActorList]
+        materials = [self.capture_material(material) for material in self.figure.Materials()]
+        material_names = [m['name'] for m in materials]
+        actors = [self.capture_actor(actor, i in unimesh, material_names) for i, actor in enumerate(self.actors)]
+        self.capture_frames(actors, frames)
+        return {'version': VERSION, 'content_root': self.content_root, 'num_frames': self.scene.NumFrames(),
+                'frames': list(frames),
+                'figure': {'name': self.figure.Name(), 'root': root, 'unimesh': unimesh, 'materials': materials},
+                'actors': actors}
+
+    def walk(self, actor):
+        for child in actor.Children():
+            self.actor_index(child)
+            self.walk(child)
+
+    def capture_material(self, material):
+        return {'name': material.Name(), 'texture': material.TextureMapFileName(),
+                'bump': material.BumpMapFileName(), 'transparency': material.TransparencyMapFileName(),
+                'diffuse': tuple(material.DiffuseColor()), 'specular': tuple(material.SpecularColor())}
+
+    def capture_actor(self, actor, with_geometry, material_names):
+        parent = actor.Parent()
+        data = {'name': actor.Name(), 'internal_name': actor.InternalName(), 'body_part': actor.IsBodyPart(),
+                'parent': self.indices.get(parent.InternalName(), -1) if parent is not None else -1,
+                'children': [self.indices[child.InternalName()] for child in actor.Children()],
+                'world_matrix': tuple([tuple(row) for row in actor.WorldMatrix()]),
+                'local_matrix': tuple([tuple(row) for row in actor.LocalMatrix()]),
+                'geometry': None, 'morphs': []}
+        geom = actor.Geometry()
+        if with_geometry and geom:
+            data['geometry'] = self.capture_geometry(geom, material_names)
+            data['morphs'] = [self.capture_morph(p, geom.NumVertices()) for p in actor.Parameters()
+                              if p.IsMorphTarget()]
+        return data
+
+    def capture_geometry(self, geom, material_names):
+        names = list(material_names)
+        polygon_materials = []
+        for polygon in geom.Polygons():
+            if polygon.MaterialName() not in names:
+                names.append(polygon.MaterialName())
+            polygon_materials.append(names.index(polygon.MaterialName()))
+        flat = lambda pairs: [f for pair in pairs for f in pair]
+        return {'vertices': pack('d', flat([(v.X(), v.Y(), v.Z()) for v in geom.Vertices()])),
+                'normals': pack('d', flat([(n.X(), n.Y(), n.Z()) for n in geom.Normals()])),
+                'tex_vertices': pack('d', flat([(t.U(), t.V()) for t in geom.TexVertices()])),
+                'polygons': pack('i', flat([(p.Start(), p.NumVertices()) for p in geom.Polygons()])),
+                'tex_polygons': pack('i', flat([(p.Start(), p.NumTexVertices()) for p in geom.TexPolygons()])),
+                'material_names': names, 'polygon_materials': pack('i', polygon_materials),
+                'sets': pack('i', geom.Sets()), 'tex_sets': pack('i', geom.TexSets())}
+
+    def capture_morph(self, parameter, num_vertices):
+        # only vertices the morph actually moves are stored
+        indices = []
+        deltas = []
+        for v in xrange(num_vertices):
+            delta = parameter.MorphTargetDelta(v)
+            if delta[0] or delta[1] or delta[2]:
+                indices.append(v)
+                deltas.extend(delta)
+        return {'name': parameter.Name(), 'value': parameter.Value(), 'hidden': parameter.Hidden(),
+                'indices': pack('i', indices), 'deltas': pack('d', deltas)}
+
+    def capture_frames(self, actors, frames):
+        origins = [array('d') for actor in self.actors]
+        quaternions = [array('d') for actor in self.actors]
+        current_frame = self.scene.Frame()
+        for frame in frames:
+            self.scene.SetFrame(frame)
+            for i, actor in enumerate(self.actors):
+                origins[i].extend(actor.Origin())
+                quaternions[i].extend(actor.LocalQuaternion())
+            self.scene.ProcessSomeEvents()
+        self.scene.SetFrame(current_frame)
+        for i, data in enumerate(actors):
+            data['origins'] = ('d', sys.byteorder, origins[i].tostring())
+            data['quaternions'] = ('d', sys.byteorder, quaternions[i].tostring())
+
+
+if __name__ == '__main__':
+    import poser
+    figure = poser.Scene().CurrentFigure()
+    assert figure, 'No currently selected figure!'
+    getSaveFile = poser.DialogFileChooser(2, 0, "Save Snapshot", figure.Name(), '', '*.p2es')
+    getSaveFile.Show()
+    fileName = getSaveFile.Path()
+    print 'Capturing', figure.Name(), 'to', fileName
+    save(SnapshotCapture(poser.Scene(), figure, poser.ContentRootLocation()).capture(), fileName)
+    print 'finished writing snapshot'
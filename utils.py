@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import string
 import math
 
 
@@ -45,6 +44,13 @@ def get_matrix(t):
             (t[0], t[1], t[2], 1))
 
 
+def nan_to_zero(f):
+    # poser reports broken normals as nan
+    if f != f:
+        return 0.0
+    return f
+
+
 def radians_to_degrees(rads):
     return (rads[0] * 180 / math.pi, rads[1] * 180 / math.pi, rads[2] * 180 / math.pi)
 
@@ -54,21 +60,58 @@ def radians_to_degrees(rads):
 ############################################################
 
 
+class ChunkBuffer:
+    """
+    Collects egg text as whole string chunks. Appending a string to a plain list with `lines += 'text'`
+    extends it one character at a time, so every writer should build its output through this instead.
+    """
+
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+
+    def write(self, s):
+        self.chunks.append(s)
+
+    def write_indented(self, s, level):
+        self.chunks.append(indent_string(s, level))
+
+    def write_block(self, lines, level):
+        # indent every line of the block and store it as a single chunk
+        pad = '  ' * level
+        self.chunks.append(''.join([pad + ln for ln in lines]))
+
+    def writelines(self, chunks):
+        self.chunks.extend(chunks)
+
+    def extend(self, other):
+        self.chunks.extend(other.chunks)
+
+    def tell(self):
+        return sum([len(chunk) for chunk in self.chunks])
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
 def write_comment(comment, level):
-    r = [indent_string('<Comment> {\n', level)]
-    for ln in comment.splitlines():
-        r.append(indent_string('"%s"' % ln, level + 1))
-    r.append(indent_string('\n}\n', level))
-    return string.join(r)
-
-
-def write_transform(matrix, level):
-    r = [indent_string('<Transform> {\n', level)]
-    r += indent_string('<Matrix4> {\n', level + 1)
-    for row in matrix:
-        s = " ".join([str(f) for f in row])
-        r.append(indent_string(s, level + 2))
-        r.append('\n')
-    r.append(indent_string('}\n', level + 1))
-    r.append(indent_string('}\n', level))
+    r = ChunkBuffer()
+    r.write_indented('<Comment> {\n', level)
+    r.write_block(['"%s"\n' % ln for ln in comment.splitlines()], level + 1)
+    r.write_indented('}\n', level)
+    return r
+
+
+def write_transform(matrix, level, format_float=str):
+    r = ChunkBuffer()
+    r.write_indented('<Transform> {\n', level)
+    r.write_indented('<Matrix4> {\n', level + 1)
+    r.write_block(["%s\n" % " ".join([format_float(f) for f in row]) for row in matrix], level + 2)
+    r.write_indented('}\n', level + 1)
+    r.write_indented('}\n', level)
     return r
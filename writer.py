@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+import Queue
+import struct
+import threading
+from array import array
+from itertools import groupby
+from operator import itemgetter
+
+from utils import *
+import eggbin
+from formatting import Precision, VertexFormatter
+
+
+# File-like object that zlib compresses everything written to it, the format Panda3D reads as .pz. Text is
+# gathered into CHUNK_SIZE blocks and deflated on a background thread (zlib releases the GIL), so compression
+# overlaps with formatting the egg instead of adding to it.
+class CompressedStream:
+    CHUNK_SIZE = 1 << 18
+    # blocks waiting for the compressor, bounds the memory when formatting is faster than compression
+    QUEUE_SIZE = 16
+
+    def __init__(self, stream, level=6):
+        self.stream = stream
+        self.compressor = zlib.compressobj(level)
+        self.pending = []
+        self.pending_size = 0
+        # uncompressed bytes handed to the compressor
+        self.size = 0
+        self.error = None
+        self.queue = Queue.Queue(self.QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._compress)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _compress(self):
+        compress = self.compressor.compress
+        write = self.stream.write
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is None:
+                try:
+                    write(compress(data))
+                except Exception, e:
+                    # raised on the formatting thread by the next submit or close
+                    self.error = e
+
+    def _submit(self):
+        if self.error is not None:
+            raise self.error
+        if self.pending:
+            self.queue.put(''.join(self.pending))
+            self.size += self.pending_size
+            self.pending = []
+            self.pending_size = 0
+
+    def write(self, s):
+        self.pending.append(s)
+        self.pending_size += len(s)
+        if self.pending_size >= self.CHUNK_SIZE:
+            self._submit()
+
+    def writelines(self, chunks):
+        for s in chunks:
+            self.write(s)
+
+    def tell(self):
+        return self.size + self.pending_size
+
+    def flush(self):
+        self._submit()
+
+    def close(self):
+        # the compressor thread gets its sentinel and the file is closed even when a write failed, then the
+        # stored error is raised
+        try:
+            try:
+                self._submit()
+            finally:
+                self.queue.put(None)
+                self.thread.join()
+            if self.error is not None:
+                raise self.error
+            self.stream.write(self.compressor.flush())
+        finally:
+            self.stream.close()
+
+
+def open_output(filename, mode, buffer_size, compress_level=6):
+    # files ending in .pz are compressed on the fly
+    if filename.lower().endswith('.pz'):
+        return CompressedStream(open(filename, 'wb', buffer_size), compress_level)
+    return open(filename, mode, buffer_size)
+
+
+# Streams egg text straight into a file handle, one chunk at a time, so memory
+# stays flat no matter how big the figure is.
+class EggWriter:
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.write = stream.write
+
+    @classmethod
+    def open(cls, filename, compress_level=6):
+        return cls(open_output(filename, 'w', cls.BUFFER_SIZE, compress_level))
+
+    def close(self):
+        self.stream.close()
+
+    def tell(self):
+        return self.stream.tell()
+
+    def write_buffer(self, buf):
+        self.stream.writelines(buf.chunks)
+
+    def write_header(self, figure_name):
+        self.write("<CoordinateSystem> { Y-Up-Right }\n")
+        self.write_buffer(write_comment('poser2egg - ' + figure_name, 0))
+
+    def write_figure_begin(self, figure_name):
+        self.write("<Group> %s {\n  <Dart> { 1 }\n" % (figure_name, ))
+
+    def write_figure_end(self, figure_name):
+        self.write('} // End Group: %s \n' % (figure_name, ))
+
+    def write_materials(self, materials, textures, write_textures=True, precision=None):
+        for material in materials.values():
+            self.write_buffer(material.write(precision))
+        if write_textures:
+            for texture in textures.values():
+                self.write_buffer(texture.write())
+
+    def write_joints(self, joints, indent=1, precision=None):
+        write = self.write
+        format_float = (precision or Precision()).formatter('matrix')
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            write(indent_string('  <Joint> %s {\n' % joint_name, indent))
+            self.write_buffer(write_transform(joint_matrix, indent + 1, format_float))
+            write(indent_string('<VertexRef> {\n', indent + 1))
+            write(indent_string('%s\n' % ' '.join([str(v) for v in vertex_refs]), indent + 2))
+            write(indent_string('<Ref> { mesh }\n', indent + 2))
+            write(indent_string('}\n', indent + 1))
+            self.write_joints(child_joints, indent + 1, precision)
+            write(indent_string('  } // End joint %s \n' % joint_name, indent))
+
+    def write_vertex_pool(self, vertices, tangents=None, precision=None, morphs=None):
+        self.write_vertex_pool_begin()
+        self.write_vertex_rows(vertices, tangents, precision, morphs)
+        self.write_vertex_pool_end()
+
+    def write_vertex_pool_begin(self):
+        self.write('  <VertexPool> mesh {\n')
+
+    def write_vertex_rows(self, vertices, tangents=None, precision=None, morphs=None, first=0, last=None):
+        # rows of vertices[first:last], incremental exports write the pool one actor at a time
+        write = self.write
+        for block in VertexFormatter(precision).blocks(vertices, tangents, morphs, first, last):
+            write(block)
+
+    def write_vertex_pool_end(self):
+        self.write('  } // End VertexPool: mesh\n')
+
+    def write_polygons(self, polygons, materials, write_textures=True, material_groups=False):
+        for (group_name, group_polys) in polygons:
+            self.write_polygon_group(group_name, group_polys, materials, write_textures, material_groups)
+
+    def write_polygon_group(self, group_name, group_polys, materials, write_textures=True, material_groups=False):
+        write = self.write
+        # <TRef>/<MRef> text is prepared once per material, see EggMaterial.polygon_headers
+        headers = dict([(name, material.polygon_headers[bool(write_textures)])
+                        for name, material in materials.items()])
+        write("<Group> %s {\n" % (group_name, ))
+        if material_groups:
+            # polygons are sorted by material, every run gets its own group
+            for material_name, material_polys in groupby(group_polys, itemgetter(0)):
+                write("<Group> %s {\n" % egg_safe_same('%s_%s' % (group_name, material_name)))
+                for (material_name, vertex_indices) in material_polys:
+                    write("%s%s <Ref> { mesh } } \n}\n" % (headers[material_name],
+                                                            ' '.join(map(str, vertex_indices))))
+                write("}\n")
+        else:
+            for (material_name, vertex_indices) in group_polys:
+                write("%s%s <Ref> { mesh } } \n}\n" % (headers[material_name], ' '.join(map(str, vertex_indices))))
+        write("\n}\n")
+
+    def write_animation(self, figure_name, joints, channels, precision=None):
+        self.write('<Table> {\n')
+        self.write(indent_string('<Bundle> %s {\n' % figure_name, 1))
+        self.write(indent_string('<Table> "<skeleton>" {\n', 2))
+        self.write_animation_table(joints, channels, 3, precision)
+        self.write(indent_string('}\n', 2))
+        self.write(indent_string('}\n', 1))
+        self.write('}')
+
+    def write_animation_table(self, joints, channels, indent=1, precision=None):
+        write = self.write
+        format_float = (precision or Precision()).formatter('animation')
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            write(indent_string('<Table> %s {\n' % joint_name, indent))
+            write(indent_string('<Xfm$Anim_S$> xform {\n', indent + 1))
+            write(indent_string('<Scalar> order { sprht }\n', indent + 2))
+            write(indent_string('<Scalar> fps { %u }\n' % 2, indent + 2))
+            for (channel, values) in channels[joint_name]:
+                write(indent_string('<S$Anim> %s { <V> { %s } }\n' % (channel, ' '.join(map(format_float, values))),
+                                    indent + 2))
+            write(indent_string('}\n', indent + 1))
+            self.write_animation_table(child_joints, channels, indent + 2, precision)
+            write(indent_string('} // End table %s \n' % joint_name, indent))
+
+
+# Writes the same targets as EggWriter in the binary .p2eb format documented in eggbin.py. The file loads into
+# Panda3D without text parsing, eggbin.py converts it to BAM. Floats are stored as they are, precision settings
+# only apply to text.
+class BinaryEggWriter:
+    BUFFER_SIZE = 1 << 20
+    VERTEX_POOL = 'mesh'
+    FPS = 2
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.write = stream.write
+        # poser material name (the key of the materials dict, polygons carry it) -> index of its record, polygons
+        # refer to materials by index
+        self.material_indices = {}
+        self.write(eggbin.MAGIC + struct.pack('<H', eggbin.VERSION))
+
+    @classmethod
+    def open(cls, filename, compress_level=6):
+        return cls(open_output(filename, 'wb', cls.BUFFER_SIZE, compress_level))
+
+    def close(self):
+        self.stream.close()
+
+    def tell(self):
+        return self.stream.tell()
+
+    def write_string(self, s):
+        self.write(struct.pack('<H', len(s)) + s)
+
+    def write_array(self, arr):
+        self.write(eggbin.little_endian(arr).tostring())
+
+    def write_header(self, figure_name):
+        self.write(eggbin.HEADER)
+        self.write_string(figure_name)
+
+    def write_figure_begin(self, figure_name):
+        self.write(eggbin.GROUP)
+        self.write_string(figure_name)
+        self.write(struct.pack('<B', 1))
+
+    def write_figure_end(self, figure_name):
+        self.write(eggbin.END)
+
+    def write_materials(self, materials, textures, write_textures=True, precision=None):
+        for name, material in materials.items():
+            self.material_indices[name] = len(self.material_indices)
+            self.write(eggbin.MATERIAL)
+            self.write_string(material.name)
+            self.write(struct.pack('<7dB', *(material.diffuse + material.specular +
+                                             (material.shininess, len(material.textures)))))
+            for texture_name in material.textures:
+                self.write_string(texture_name)
+        if write_textures:
+            for texture in textures.values():
+                self.write(eggbin.TEXTURE)
+                self.write_string(texture.name)
+                self.write_string(texture.filename)
+                self.write_string(texture.envtype)
+                self.write(struct.pack('<B', texture.alpha))
+
+    def write_joints(self, joints, indent=1, precision=None):
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            self.write(eggbin.JOINT)
+            self.write_string(joint_name)
+            self.write(struct.pack('<16d', *[f for row in joint_matrix for f in row]))
+            self.write_string(self.VERTEX_POOL)
+            self.write(struct.pack('<I', len(vertex_refs)))
+            self.write_array(array('I', vertex_refs))
+            self.write_joints(child_joints, indent + 1, precision)
+            self.write(eggbin.END)
+
+    def write_vertex_pool(self, vertices, tangents=None, precision=None, morphs=None):
+        if morphs:
+            # the Panda3D egg API has no access to vertex morphs, so the loader could not apply them
+            print 'Morph sliders are not stored in binary eggs, export a text egg to keep them'
+        self.write(eggbin.VERTEX_POOL)
+        self.write_string(self.VERTEX_POOL)
+        self.write(struct.pack('<I', len(vertices)))
+        values = array('f')
+        for (v_tuple, n, t) in vertices:
+            values.extend(v_tuple)
+            values.extend(n)
+            values.extend(t)
+        self.write_array(values)
+        if tangents is not None:
+            self.write(eggbin.TANGENTS)
+            self.write_string(self.VERTEX_POOL)
+            self.write(struct.pack('<I', len(tangents)))
+            values = array('f')
+            for (tangent, binormal) in tangents:
+                values.extend(tangent)
+                values.extend(binormal)
+            self.write_array(values)
+
+    def write_polygons(self, polygons, materials, write_textures=True, material_groups=False):
+        for (group_name, group_polys) in polygons:
+            if material_groups:
+                # a group record holding one polygons record per material
+                self.write(eggbin.GROUP)
+                self.write_string(group_name)
+                self.write(struct.pack('<B', 0))
+                for material_name, material_polys in groupby(group_polys, itemgetter(0)):
+                    self.write_polygon_record(egg_safe_same('%s_%s' % (group_name, material_name)),
+                                              list(material_polys), write_textures)
+                self.write(eggbin.END)
+            else:
+                self.write_polygon_record(group_name, group_polys, write_textures)
+
+    def write_polygon_record(self, group_name, group_polys, write_textures=True):
+        material_indices = self.material_indices
+        values = array('I')
+        for (material_name, vertex_indices) in group_polys:
+            values.append(material_indices[material_name])
+            values.append(len(vertex_indices))
+            values.extend(vertex_indices)
+        self.write(eggbin.POLYGONS)
+        self.write_string(group_name)
+        self.write_string(self.VERTEX_POOL)
+        self.write(struct.pack('<BII', write_textures, len(group_polys), len(values)))
+        self.write_array(values)
+
+    def write_animation(self, figure_name, joints, channels, precision=None):
+        self.write(eggbin.BUNDLE)
+        self.write_string(figure_name)
+        self.write(struct.pack('<d', self.FPS))
+        self.write_animation_table(joints, channels)
+        self.write(eggbin.END)
+
+    def write_animation_table(self, joints, channels, indent=1, precision=None):
+        for (joint_name, joint_matrix, child_joints, vertex_refs, actor) in joints:
+            self.write(eggbin.JOINT_TABLE)
+            self.write_string(joint_name)
+            joint_channels = channels[joint_name]
+            self.write(struct.pack('<B', len(joint_channels)))
+            for (channel, values) in joint_channels:
+                self.write(channel + struct.pack('<I', len(values)))
+                self.write_array(array('d', values))
+            self.write_animation_table(child_joints, channels, indent + 1)
+            self.write(eggbin.END)